@@ -3,10 +3,35 @@
 
 import sys
 from PyQt5.QtWidgets import (QApplication, QSystemTrayIcon, QMenu, QWidget,
-                             QPushButton, QVBoxLayout, QLabel, QMainWindow, QHBoxLayout)
-from PyQt5.QtCore import Qt, QRect, QPoint, pyqtSignal, QTimer
-from PyQt5.QtGui import QIcon, QPixmap, QPainter, QPen, QCursor, QColor, QImage
+                             QPushButton, QVBoxLayout, QLabel, QMainWindow, QHBoxLayout,
+                             QActionGroup, QFileDialog, QInputDialog)
+from PyQt5.QtCore import (Qt, QRect, QRectF, QPoint, QPointF, QLineF, QEvent, pyqtSignal, QTimer, QObject,
+                          QRunnable, QThread, QThreadPool, QByteArray, QBuffer, QIODevice,
+                          QSettings)
+from PyQt5.QtGui import (QIcon, QPixmap, QPainter, QPen, QCursor, QColor, QImage,
+                         QFont, QFontMetrics, QRegion, QMouseEvent, QGuiApplication,
+                         QPolygonF, QTabletEvent, QTouchDevice)
+import argparse
+import hashlib
+import heapq
+import http.client
 import io
+import itertools
+import json
+import math
+import mimetypes
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+import urllib.parse
+import uuid
+import zlib
+from collections import deque
+from datetime import datetime
+import numpy as np
 
 
 class DraggableWidget(QWidget):
@@ -80,15 +105,286 @@ class DraggableLabel(QLabel):
             event.accept()
 
 
+def get_screenshots_dir():
+    """截图保存目录：用户家目录下的 OneDrive/图片/Screenshots（不存在则创建）"""
+    screenshots_dir = os.path.join(os.path.expanduser("~"), "OneDrive", "图片", "Screenshots")
+
+    # 如果目录不存在，创建它
+    if not os.path.exists(screenshots_dir):
+        os.makedirs(screenshots_dir)
+    return screenshots_dir
+
+
+def get_data_dir():
+    """程序数据目录（上传队列等）：用户家目录下的 .screenshot_tool"""
+    data_dir = os.path.join(os.path.expanduser("~"), ".screenshot_tool")
+    os.makedirs(data_dir, exist_ok=True)
+    return data_dir
+
+
+def _distances_to_segment(points, start, end):
+    """points 中每个点到线段 start-end 的距离（x, y, 宽度三个维度）"""
+    direction = end - start
+    length_sq = float(direction @ direction)
+    if length_sq == 0:
+        return np.linalg.norm(points - start, axis=1)
+    t = np.clip((points - start) @ direction / length_sq, 0, 1)
+    return np.linalg.norm(points - (start + t[:, None] * direction), axis=1)
+
+
+def simplify_stroke(points, tolerance):
+    """Ramer–Douglas–Peucker 简化笔画，points 为 [(x, y, 宽度), ...]
+
+    偏离首尾连线不超过 tolerance 的点被删掉，宽度变化也算偏离。
+    """
+    if len(points) < 3:
+        return list(points)
+    array = np.asarray(points, dtype=float)
+    keep = np.zeros(len(array), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(array) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distances = _distances_to_segment(array[first + 1:last], array[first], array[last])
+        index = int(distances.argmax())
+        if distances[index] > tolerance:
+            index += first + 1
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [points[i] for i in np.flatnonzero(keep)]
+
+
+def _catmull_rom(p0, p1, p2, p3, u):
+    """centripetal Catmull-Rom：每行一组控制点，返回 p1 到 p2 之间参数为 u（0~1）的点"""
+    def knot(a, b):
+        return np.maximum(np.hypot(*(b - a)[:, :2].T) ** 0.5, 1e-4)[:, None]
+
+    t0 = 0.0
+    t1 = knot(p0, p1)
+    t2 = t1 + knot(p1, p2)
+    t3 = t2 + knot(p2, p3)
+    t = t1 + (t2 - t1) * u[:, None]
+    a1 = ((t1 - t) * p0 + (t - t0) * p1) / (t1 - t0)
+    a2 = ((t2 - t) * p1 + (t - t1) * p2) / (t2 - t1)
+    a3 = ((t3 - t) * p2 + (t - t2) * p3) / (t3 - t2)
+    b1 = ((t2 - t) * a1 + (t - t0) * a2) / (t2 - t0)
+    b2 = ((t3 - t) * a2 + (t - t1) * a3) / (t3 - t1)
+    return ((t2 - t) * b1 + (t - t1) * b2) / (t2 - t1)
+
+
+def stroke_samples(points, start=0, end=None, spacing=3.0):
+    """把笔画的点 [(x, y, 宽度), ...] 平滑成密集的采样点数组
+
+    只生成第 start 到 end 段（第 i 段连接点 i 和 i+1），首尾缺少的控制点用端点代替。
+    每段按长度取样，所有段一起计算。
+    """
+    array = np.asarray(points, dtype=float).reshape(-1, 3)
+    count = len(array)
+    if end is None:
+        end = count - 1
+    if count < 2 or start >= end:
+        return array[start:start + 1]
+    index = np.arange(start, end)
+    p1, p2 = array[index], array[index + 1]
+    steps = np.maximum(1, np.ceil(np.hypot(*(p2 - p1)[:, :2].T) / spacing)).astype(int)
+    segment = np.repeat(np.arange(len(index)), steps)
+    # 每段取 0, 1/steps, ..., (steps-1)/steps，最后补上终点
+    u = (np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)) / steps[segment]
+    p0 = array[np.maximum(index - 1, 0)][segment]
+    p3 = array[np.minimum(index + 2, count - 1)][segment]
+    samples = _catmull_rom(p0, p1[segment], p2[segment], p3, u)
+    return np.concatenate([samples, array[end:end + 1]])
+
+
+def draw_samples(painter, samples, color):
+    """按采样点画线，宽度按 0.25 像素分级，同一级的连续段一次画成折线"""
+    samples = np.asarray(samples, dtype=float).reshape(-1, 3)
+    widths = np.maximum(samples[:, 2], 0.5)
+    if len(samples) == 1:
+        x, y, _ = samples[0].tolist()
+        painter.setPen(QPen(color, float(widths[0]), Qt.SolidLine, Qt.RoundCap))
+        painter.drawPoint(QPointF(x, y))
+        return
+    points = [QPointF(x, y) for x, y in samples[:, :2].tolist()]
+    pen_widths = np.round((widths[:-1] + widths[1:]) * 2) / 4
+    starts = [0] + (np.flatnonzero(np.diff(pen_widths)) + 1).tolist()
+    ends = starts[1:] + [len(pen_widths)]
+    for first, last in zip(starts, ends):
+        painter.setPen(QPen(color, float(pen_widths[first]), Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin))
+        painter.drawPolyline(QPolygonF(points[first:last + 1]))
+
+
+def samples_rect(samples):
+    """采样点（含线宽）覆盖的区域"""
+    samples = np.asarray(samples, dtype=float).reshape(-1, 3)
+    margin = samples[:, 2].max() / 2 + 2
+    left, top = samples[:, :2].min(axis=0) - margin
+    right, bottom = samples[:, :2].max(axis=0) + margin
+    return QRectF(left, top, right - left, bottom - top).toAlignedRect()
+
+
+PROJECT_MAGIC = b"SITMPRJ1"
+# 宽, 高, 每行字节数, QImage 格式, 设备像素比, 标注记录（JSON）的位置
+PROJECT_HEADER = struct.Struct("<IIIIdQ")
+PROJECT_DATA_OFFSET = 4096  # 像素数据按页对齐，打开时可以直接映射
+# 文件头中“标注记录位置”字段的偏移
+PROJECT_JSON_OFFSET_FIELD = len(PROJECT_MAGIC) + PROJECT_HEADER.size - 8
+
+
+def _project_meta(ops, image_path):
+    return {"version": 1, "image": os.path.basename(image_path), "ops": ops}
+
+
+def write_frame_file(path, image, meta):
+    """把截图像素（不压缩）和 JSON 元数据写入文件（工程文件和截图暂存区共用的格式）
+
+    文件格式：8 字节魔数 + 文件头，像素数据从第 4096 字节开始，之后是 JSON。
+    通过内存映射写入，像素只需一次内存复制；先写临时文件再替换，中途失败不会留下半个文件。
+    """
+    if image.format() not in (QImage.Format_RGB32, QImage.Format_ARGB32,
+                              QImage.Format_ARGB32_Premultiplied):
+        image = image.convertToFormat(QImage.Format_RGB32)
+    size = image.bytesPerLine() * image.height()
+    ptr = image.constBits()
+    ptr.setsize(size)
+    json_offset = PROJECT_DATA_OFFSET + size
+    data = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "w+b") as f:
+        f.truncate(json_offset + len(data))
+        with mmap.mmap(f.fileno(), 0) as mapping:
+            mapping[:len(PROJECT_MAGIC)] = PROJECT_MAGIC
+            PROJECT_HEADER.pack_into(mapping, len(PROJECT_MAGIC), image.width(), image.height(),
+                                     image.bytesPerLine(), int(image.format()),
+                                     image.devicePixelRatio(), json_offset)
+            mapping[PROJECT_DATA_OFFSET:json_offset] = ptr
+            mapping[json_offset:] = data
+    os.replace(temp_path, path)
+
+
+def _read_frame_header(f, path):
+    """读取文件头和 JSON 元数据，返回 (文件头各字段, 像素数据结束位置, 元数据)
+
+    JSON 从文件头记录的位置开始，只解析第一个 JSON 值，后面残留的旧记录忽略。
+    """
+    header = f.read(len(PROJECT_MAGIC) + PROJECT_HEADER.size)
+    if header[:len(PROJECT_MAGIC)] != PROJECT_MAGIC:
+        raise ValueError(f"不是截图工程文件: {path}")
+    fields = PROJECT_HEADER.unpack_from(header, len(PROJECT_MAGIC))
+    _, height, bytes_per_line, _, _, json_offset = fields
+    data_end = PROJECT_DATA_OFFSET + bytes_per_line * height
+    if json_offset < data_end:
+        raise ValueError(f"工程文件已损坏: {path}")
+    f.seek(json_offset)
+    try:
+        meta, _ = json.JSONDecoder().raw_decode(f.read().decode("utf-8"))
+    except ValueError:
+        raise ValueError(f"工程文件已损坏: {path}") from None
+    return fields, data_end, meta
+
+
+def read_frame_meta(path):
+    """只读取 write_frame_file 写入的 JSON 元数据，不映射像素"""
+    with open(path, "rb") as f:
+        return _read_frame_header(f, path)[2]
+
+
+def open_frame_file(path):
+    """打开 write_frame_file 写入的文件，返回 (截图, 元数据, 文件映射)
+
+    截图是直接建立在文件映射上的 QImage，不解码也不复制，画到哪部分才读哪部分；
+    QImage 释放后才能关闭文件映射。
+    """
+    with open(path, "rb") as f:
+        fields, data_end, meta = _read_frame_header(f, path)
+        width, height, bytes_per_line, image_format, ratio, _ = fields
+        # 写时复制：映射只读进需要的页，意外写入也不会改到文件
+        mapping = mmap.mmap(f.fileno(), data_end, access=mmap.ACCESS_COPY)
+
+    image = QImage(memoryview(mapping)[PROJECT_DATA_OFFSET:], width, height,
+                   bytes_per_line, QImage.Format(image_format))
+    image.setDevicePixelRatio(ratio)
+    return image, meta, mapping
+
+
+def save_project(path, base, ops, image_path):
+    """保存可再编辑的工程文件：未标注的截图像素 + 标注记录
+
+    base 为未标注的截图（QPixmap 或 QImage），image_path 为对应的 PNG。
+    """
+    image = base.toImage() if isinstance(base, QPixmap) else base
+    write_frame_file(path, image, _project_meta(ops, image_path))
+
+
+def update_project_ops(path, ops, image_path):
+    """只更新工程文件末尾的标注记录，截图像素不动（文件正被映射时也可以写）
+
+    新记录不覆盖当前记录：放得下时写在像素之后、当前记录之前的空位，否则追加到文件末尾。
+    新记录落盘后才改文件头里的位置，任何时刻中断，文件头都指向一份完整的记录。
+    """
+    data = json.dumps(_project_meta(ops, image_path), ensure_ascii=False).encode("utf-8")
+    with open(path, "r+b") as f:
+        header = f.read(len(PROJECT_MAGIC) + PROJECT_HEADER.size)
+        if header[:len(PROJECT_MAGIC)] != PROJECT_MAGIC:
+            raise ValueError(f"不是截图工程文件: {path}")
+        _, height, bytes_per_line, _, _, json_offset = \
+            PROJECT_HEADER.unpack_from(header, len(PROJECT_MAGIC))
+        data_end = PROJECT_DATA_OFFSET + bytes_per_line * height
+        new_offset = data_end if len(data) <= json_offset - data_end else f.seek(0, os.SEEK_END)
+
+        f.seek(new_offset)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+        f.seek(PROJECT_JSON_OFFSET_FIELD)
+        f.write(struct.pack("<Q", new_offset))
+        f.flush()
+        os.fsync(f.fileno())
+
+        if new_offset == data_end:
+            # 旧记录已不再被引用，截掉；失败（如 Windows 上文件正被映射）只是多占些空间
+            try:
+                f.truncate(data_end + len(data))
+            except OSError:
+                pass
+
+
+def load_project(path):
+    """打开工程文件，返回 (截图, 标注记录, PNG 路径, 文件映射)，使用期间要保留文件映射对象"""
+    image, meta, mapping = open_frame_file(path)
+    image_path = os.path.join(os.path.dirname(os.path.abspath(path)), meta["image"])
+    return image, meta["ops"], image_path, mapping
+
+
 class ScreenshotEditor(QMainWindow):
     """截图编辑窗口，支持画笔标注"""
     closed = pyqtSignal()
-
-    def __init__(self, pixmap):
+    saved = pyqtSignal(str)
+    copied = pyqtSignal(QImage)
+    undone = pyqtSignal()  # 撤销了一个标注（按钮或 Ctrl+Z），供输入事件录制
+
+    MIN_DISTANCE = 2.0        # 离上一个点太近的输入点不保留（像素）
+    WIDTH_STEP = 0.5          # 宽度变化超过该值时即使很近也保留
+    MAX_SEGMENT = 40.0        # 合并共线点时一段的最大长度
+    SIMPLIFY_TOLERANCE = 0.5  # 合并共线点和抬笔后简化的误差（像素）
+    MIN_WIDTH = 1.0
+
+    PEN_ACTIONS = {
+        QEvent.TabletPress: "press", QEvent.TouchBegin: "press",
+        QEvent.TabletMove: "move", QEvent.TouchUpdate: "move",
+        QEvent.TabletRelease: "release", QEvent.TouchEnd: "release",
+        QEvent.TouchCancel: "release",
+    }
+
+    def __init__(self, pixmap, highlights=None, ops=None):
         super().__init__()
+        # 未标注的截图（QPixmap，或打开工程文件时映射文件得到的 QImage）
         self.pixmap = pixmap
-        self.drawing = False
-        self.last_point = QPoint()
         self.pen_width = 3
         self.pen_color = Qt.red
         self.draw_mode = "line"  # "line" or "arrow"
@@ -96,15 +392,49 @@ class ScreenshotEditor(QMainWindow):
         self.arrow_end = QPoint()
         self.temp_arrow_drawing = False
 
+        # 标注记录：每个笔画/箭头一项，画布上的标注都可以由它重新画出
+        self.ops = []
+        self.op_rects = []
+        self.raw_point_count = 0
+
+        # 工程文件：save_project 为 True 时保存截图的同时保存工程文件；
+        # 从工程文件打开时 project_path/image_path 为原来的文件，保存时覆盖
+        self.save_project = False
+        self.project_path = None
+        self.image_path = None
+        self.base_mapping = None
+
+        # 截图暂存区：设置后保存时只写入暂存区，由它在空闲时编码并发出完成信号；
+        # spool_entry 为这张截图在暂存区中的条目
+        self.spool = None
+        self.spool_entry = None
+
+        # 正在画的笔画：已确定形状的部分画在 stroke_layer 上，抬笔后再整笔画到画布
+        self.stroke = None
+        self.stroke_source = None  # "mouse" 或 "pen"（触控笔/触摸）
+        self.stroke_layer = None
+
         self.setWindowTitle("截图编辑")
         self.setWindowState(Qt.WindowFullScreen)
         self.setWindowFlags(Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint)
 
-        # 创建画布
-        self.canvas = QPixmap(self.pixmap)
+        # 画布（截图 + 标注）用到时才生成，在此之前只重绘需要的区域
+        self.canvas = None
+        for op in ops or []:
+            self.add_op(op)
+
+        # 对比模式：在画布上框出变化区域
+        if highlights is not None:
+            self.draw_highlights(highlights)
+            if highlights:
+                hint_text = f"🔍 发现 {len(highlights)} 处差异 | 按住此框可移动"
+            else:
+                hint_text = "🔍 两张截图完全相同 | 按住此框可移动"
+        else:
+            hint_text = "✏️ 手指拖动画红线标注 | 按住此框可移动"
 
         # 创建可拖动的提示标签
-        self.hint_label = DraggableLabel("✏️ 手指拖动画红线标注 | 按住此框可移动", self)
+        self.hint_label = DraggableLabel(hint_text, self)
         self.hint_label.setStyleSheet("""
             background-color: rgba(0, 0, 0, 180);
             color: white;
@@ -123,6 +453,18 @@ class ScreenshotEditor(QMainWindow):
         self.create_toolbar()
 
         self.setCursor(Qt.CrossCursor)
+        # 直接接收触摸事件（带压力），不让 Qt 转成鼠标事件
+        self.setAttribute(Qt.WA_AcceptTouchEvents)
+
+    @classmethod
+    def from_project(cls, path):
+        """打开工程文件，返回编辑窗口（截图按需从文件读取，不解码）"""
+        image, ops, image_path, mapping = load_project(path)
+        editor = cls(image, ops=ops)
+        editor.project_path = path
+        editor.image_path = image_path
+        editor.base_mapping = mapping
+        return editor
 
     def create_toolbar(self):
         """创建可拖动的触屏按钮工具栏"""
@@ -213,11 +555,21 @@ class ScreenshotEditor(QMainWindow):
         """)
         btn_layout.addWidget(self.arrow_btn)
 
+        # 撤销按钮
+        self.undo_btn = QPushButton("↶ 撤销")
+        self.undo_btn.clicked.connect(self.undo)
+        btn_layout.addWidget(self.undo_btn)
+
         # 保存按钮
         self.save_btn = QPushButton("✓ 保存")
         self.save_btn.clicked.connect(self.save_screenshot)
         btn_layout.addWidget(self.save_btn)
 
+        # 复制按钮
+        self.copy_btn = QPushButton("📋 复制")
+        self.copy_btn.clicked.connect(self.copy_to_clipboard)
+        btn_layout.addWidget(self.copy_btn)
+
         # 取消按钮
         self.cancel_btn = QPushButton("✗ 取消")
         self.cancel_btn.setObjectName("cancelBtn")
@@ -241,7 +593,26 @@ class ScreenshotEditor(QMainWindow):
     def paintEvent(self, event):
         """绘制画布"""
         painter = QPainter(self)
-        painter.drawPixmap(0, 0, self.canvas)
+        if self.canvas is not None:
+            painter.drawPixmap(0, 0, self.canvas)
+        else:
+            # 还没有生成画布：只画需要重绘区域内的截图和标注
+            rect = event.rect()
+            painter.setClipRect(rect)
+            if isinstance(self.pixmap, QImage):
+                painter.drawImage(QPoint(0, 0), self.pixmap)
+            else:
+                painter.drawPixmap(0, 0, self.pixmap)
+            for op, op_rect in zip(self.ops, self.op_rects):
+                if op_rect.intersects(rect):
+                    self.draw_op(painter, op)
+            painter.setRenderHint(QPainter.Antialiasing, False)
+
+        # 正在画的笔画：最后一段的形状还要等下一个点才能确定，先用直线连到笔尖
+        if self.stroke is not None:
+            painter.drawPixmap(0, 0, self.stroke_layer)
+            painter.setRenderHint(QPainter.Antialiasing)
+            draw_samples(painter, self.stroke_tail(), self.pen_color)
 
         # 如果正在绘制临时箭头，显示预览
         if self.temp_arrow_drawing and self.draw_mode == "arrow":
@@ -257,9 +628,10 @@ class ScreenshotEditor(QMainWindow):
                 return
 
             if self.draw_mode == "line":
-                self.drawing = True
-                self.last_point = event.pos()
+                if self.stroke is None:
+                    self.begin_stroke(event.localPos(), self.pen_width, "mouse")
             elif self.draw_mode == "arrow":
+                self.ensure_canvas()
                 self.temp_arrow_drawing = True
                 self.arrow_start = event.pos()
                 self.arrow_end = event.pos()
@@ -271,13 +643,8 @@ class ScreenshotEditor(QMainWindow):
             if self.toolbar.geometry().contains(event.pos()):
                 return
 
-            if self.draw_mode == "line" and self.drawing:
-                painter = QPainter(self.canvas)
-                pen = QPen(self.pen_color, self.pen_width, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
-                painter.setPen(pen)
-                painter.drawLine(self.last_point, event.pos())
-                self.last_point = event.pos()
-                self.update()
+            if self.draw_mode == "line" and self.stroke_source == "mouse":
+                self.extend_stroke(event.localPos(), self.pen_width)
             elif self.draw_mode == "arrow" and self.temp_arrow_drawing:
                 self.arrow_end = event.pos()
                 self.update()
@@ -285,18 +652,249 @@ class ScreenshotEditor(QMainWindow):
     def mouseReleaseEvent(self, event):
         """鼠标/触摸释放事件"""
         if event.button() == Qt.LeftButton:
-            if self.draw_mode == "line":
-                self.drawing = False
+            if self.draw_mode == "line" and self.stroke_source == "mouse":
+                self.end_stroke(event.localPos())
             elif self.draw_mode == "arrow" and self.temp_arrow_drawing:
                 # 将箭头绘制到画布上
-                painter = QPainter(self.canvas)
-                pen = QPen(self.pen_color, self.pen_width, Qt.SolidLine, Qt.RoundCap, Qt.RoundJoin)
-                painter.setPen(pen)
-                self.draw_arrow(painter, self.arrow_start, self.arrow_end)
-                painter.end()
+                self.add_op({"type": "arrow", "color": QColor(self.pen_color).name(),
+                             "width": self.pen_width,
+                             "start": [self.arrow_start.x(), self.arrow_start.y()],
+                             "end": [self.arrow_end.x(), self.arrow_end.y()]})
                 self.temp_arrow_drawing = False
                 self.update()
 
+    def event(self, event):
+        if event.type() in (QEvent.TouchBegin, QEvent.TouchUpdate,
+                            QEvent.TouchEnd, QEvent.TouchCancel):
+            return self.handle_pen_event(event)
+        return super().event(event)
+
+    def tabletEvent(self, event):
+        """触控笔事件"""
+        self.handle_pen_event(event)
+
+    def pen_point(self, event):
+        """从触控笔/触摸事件中取出 (位置, 压力)；多指触摸返回 None
+
+        不支持压力的触摸屏压力按 0.5 处理，画出的宽度与鼠标相同。
+        """
+        if isinstance(event, QTabletEvent):
+            return event.posF(), event.pressure()
+        points = event.touchPoints()
+        if len(points) != 1:
+            return None
+        point = points[0]
+        if event.device().capabilities() & QTouchDevice.Pressure:
+            return point.pos(), point.pressure()
+        return point.pos(), 0.5
+
+    def accepts_pen_press(self, point):
+        """触控笔/手指按下时是否由编辑窗口直接画线
+
+        箭头模式和按在工具栏、提示框上时不处理，由 Qt 转成鼠标事件。
+        """
+        return (point is not None and self.draw_mode == "line" and self.stroke is None
+                and self.childAt(point[0].toPoint()) is None)
+
+    def pen_width_for(self, pressure):
+        """压力 0~1 对应的线宽，中等压力（0.5）与鼠标画线一样宽"""
+        return max(self.MIN_WIDTH, self.pen_width * 2 * pressure)
+
+    def handle_pen_event(self, event):
+        """处理触控笔/触摸事件，返回是否已处理"""
+        action = self.PEN_ACTIONS[event.type()]
+        point = self.pen_point(event)
+        if action == "press":
+            if not self.accepts_pen_press(point):
+                event.ignore()
+                return False
+            self.begin_stroke(point[0], self.pen_width_for(point[1]), "pen")
+        elif self.stroke_source != "pen":
+            event.ignore()
+            return False
+        elif action == "move":
+            if point is not None:
+                self.extend_stroke(point[0], self.pen_width_for(point[1]))
+        else:
+            # 抬笔时压力已经是 0，沿用上一个点的宽度
+            self.end_stroke(point[0] if point is not None else None)
+        event.accept()
+        return True
+
+    def begin_stroke(self, pos, width, source):
+        """开始一个笔画"""
+        self.ensure_canvas()
+        if self.stroke_layer is None:
+            self.stroke_layer = QPixmap(self.pixmap.size())
+            self.stroke_layer.setDevicePixelRatio(self.pixmap.devicePixelRatio())
+            self.stroke_layer.fill(Qt.transparent)
+        point = (pos.x(), pos.y(), width)
+        self.stroke = [point]
+        self.stroke_source = source
+        self.stroke_cursor = point
+        # stroke[-2] 之后的所有输入点，用来判断 stroke[-1] 能否沿直线延长
+        self.stroke_raw = [point]
+        self.stroke_last = 0
+        self.stroke_drawn = 0
+        self.stroke_rect = QRect()
+        self.tail_rect = QRect()
+        self.raw_point_count += 1
+        self.update_tail()
+
+    def extend_stroke(self, pos, width):
+        """笔画新增一个输入点：太近的点丢掉，与上一段共线的点合并，其余保留"""
+        point = (pos.x(), pos.y(), width)
+        self.stroke_cursor = point
+        self.raw_point_count += 1
+        last = self.stroke[-1]
+        if (math.hypot(point[0] - last[0], point[1] - last[1]) < self.MIN_DISTANCE
+                and abs(point[2] - last[2]) < self.WIDTH_STEP):
+            self.stroke_raw.append(point)
+        elif len(self.stroke) >= 2 and self._can_extend(point):
+            self.stroke_raw.append(point)
+            self.stroke[-1] = point
+            self.stroke_last = len(self.stroke_raw) - 1
+        else:
+            self.stroke_raw = self.stroke_raw[self.stroke_last + 1:] + [point]
+            self.stroke_last = len(self.stroke_raw) - 1
+            self.stroke.append(point)
+            self.draw_ready_segments()
+        self.update_tail()
+
+    def _can_extend(self, point):
+        """stroke[-2] 到新点的直线能否代替中间所有输入点"""
+        anchor = self.stroke[-2]
+        if math.hypot(point[0] - anchor[0], point[1] - anchor[1]) > self.MAX_SEGMENT:
+            return False
+        distances = _distances_to_segment(np.asarray(self.stroke_raw, dtype=float),
+                                          np.asarray(anchor, dtype=float),
+                                          np.asarray(point, dtype=float))
+        return distances.max() <= self.SIMPLIFY_TOLERANCE
+
+    def draw_ready_segments(self):
+        """把已经确定形状的段平滑后画到 stroke_layer 上（第 i 段需要点 i+2 作控制点）"""
+        ready = len(self.stroke) - 2
+        if ready <= self.stroke_drawn:
+            return
+        samples = stroke_samples(self.stroke, self.stroke_drawn, ready)
+        painter = QPainter(self.stroke_layer)
+        painter.setRenderHint(QPainter.Antialiasing)
+        draw_samples(painter, samples, self.pen_color)
+        painter.end()
+        self.stroke_drawn = ready
+        rect = samples_rect(samples)
+        self.stroke_rect = self.stroke_rect.united(rect)
+        self.update(rect)
+
+    def stroke_tail(self):
+        """还没画到 stroke_layer 上的部分：最后几个点加上当前笔尖位置"""
+        tail = self.stroke[self.stroke_drawn:]
+        if self.stroke_cursor != tail[-1]:
+            tail = tail + [self.stroke_cursor]
+        return tail
+
+    def update_tail(self):
+        """只重绘笔尖附近（上一次和这一次的末段）"""
+        rect = samples_rect(self.stroke_tail())
+        self.update(rect.united(self.tail_rect))
+        self.tail_rect = rect
+
+    def end_stroke(self, pos=None):
+        """结束笔画：简化并平滑后画到画布上，记入标注记录"""
+        if pos is not None:
+            self.extend_stroke(pos, self.stroke_cursor[2])
+        points = self.stroke
+        if self.stroke_cursor != points[-1]:
+            points = points + [self.stroke_cursor]
+        points = simplify_stroke(points, self.SIMPLIFY_TOLERANCE)
+
+        dirty = self.stroke_rect.united(self.tail_rect)
+        painter = QPainter(self.stroke_layer)
+        painter.setCompositionMode(QPainter.CompositionMode_Clear)
+        painter.fillRect(dirty, Qt.transparent)
+        painter.end()
+        self.stroke = None
+        self.stroke_source = None
+
+        rect = self.add_op({"type": "stroke", "color": QColor(self.pen_color).name(),
+                            "points": [[round(v, 2) for v in point] for point in points]})
+        self.update(dirty.united(rect))
+
+    def ensure_canvas(self):
+        """生成画布（截图 + 全部标注），第一次编辑、保存或复制时才生成"""
+        if self.canvas is None:
+            if isinstance(self.pixmap, QImage):
+                self.canvas = QPixmap.fromImage(self.pixmap)
+            else:
+                self.canvas = QPixmap(self.pixmap)
+            painter = QPainter(self.canvas)
+            for op in self.ops:
+                self.draw_op(painter, op)
+            painter.end()
+        return self.canvas
+
+    def add_op(self, op):
+        """记录一个标注（画布已生成时同时画上去），返回标注涉及的区域"""
+        self.ops.append(op)
+        self.op_rects.append(self.op_rect(op))
+        if self.canvas is not None:
+            painter = QPainter(self.canvas)
+            self.draw_op(painter, op)
+            painter.end()
+        return self.op_rects[-1]
+
+    def undo(self):
+        """撤销最后一个标注：画布作废，下次用到时由截图和其余标注重新生成"""
+        if not self.ops or self.stroke is not None:
+            return
+        self.ops.pop()
+        rect = self.op_rects.pop()
+        self.canvas = None
+        self.update(rect)
+        self.undone.emit()
+
+    def op_rect(self, op):
+        """标注在窗口中涉及的区域"""
+        if op["type"] == "stroke":
+            return samples_rect(stroke_samples(op["points"]))
+        if op["type"] == "highlight":
+            ratio = self.pixmap.devicePixelRatio()
+            rect = QRect()
+            for x, y, width, height in op["regions"]:
+                rect = rect.united(QRectF(x / ratio, y / ratio, width / ratio,
+                                          height / ratio).toAlignedRect())
+            return rect.adjusted(-6, -6, 6, 6)
+        margin = 30 + op["width"]
+        return QRect(QPoint(*op["start"]), QPoint(*op["end"])).normalized().adjusted(
+            -margin, -margin, margin, margin)
+
+    def draw_op(self, painter, op):
+        """按标注记录画出一个笔画/箭头/差异框"""
+        if op["type"] == "stroke":
+            painter.setRenderHint(QPainter.Antialiasing, True)
+            draw_samples(painter, stroke_samples(op["points"]), QColor(op["color"]))
+        elif op["type"] == "highlight":
+            # 半透明橙色框，区域坐标为物理像素
+            ratio = self.pixmap.devicePixelRatio()
+            painter.setRenderHint(QPainter.Antialiasing, False)
+            painter.setPen(QPen(QColor(255, 152, 0), 3, Qt.SolidLine))
+            painter.setBrush(QColor(255, 152, 0, 50))
+            for x, y, width, height in op["regions"]:
+                # 外扩几个像素，避免边框盖住变化的内容
+                rect = QRectF(x / ratio, y / ratio, width / ratio, height / ratio)
+                painter.drawRect(rect.adjusted(-3, -3, 3, 3))
+            painter.setBrush(Qt.NoBrush)
+        else:
+            painter.setRenderHint(QPainter.Antialiasing, False)
+            painter.setPen(QPen(QColor(op["color"]), op["width"], Qt.SolidLine,
+                                Qt.RoundCap, Qt.RoundJoin))
+            self.draw_arrow(painter, QPoint(*op["start"]), QPoint(*op["end"]))
+
+    def draw_highlights(self, regions):
+        """用半透明橙色框标出变化区域（区域坐标为物理像素），作为一个标注记录，可以撤销"""
+        if regions:
+            self.add_op({"type": "highlight", "regions": [list(region) for region in regions]})
+
     def draw_arrow(self, painter, start, end):
         """绘制箭头"""
         import math
@@ -405,34 +1003,63 @@ class ScreenshotEditor(QMainWindow):
         elif event.key() == Qt.Key_Return or event.key() == Qt.Key_Enter:
             # Enter 保存
             self.save_screenshot()
+        elif event.key() == Qt.Key_Z and event.modifiers() & Qt.ControlModifier:
+            # Ctrl+Z 撤销
+            self.undo()
 
     def save_screenshot(self):
-        """保存截图到 OneDrive 图片文件夹"""
-        from datetime import datetime
-        import os
-
-        # 保存路径：用户家目录\OneDrive\图片\Screenshots
-        screenshots_dir = os.path.join(os.path.expanduser("~"), "OneDrive", "图片", "Screenshots")
-
-        # 如果目录不存在，创建它
-        if not os.path.exists(screenshots_dir):
-            os.makedirs(screenshots_dir)
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"screenshot_{timestamp}.png"
-        filepath = os.path.join(screenshots_dir, filename)
-
-        self.canvas.save(filepath, "PNG")
+        """保存截图到 OneDrive 图片文件夹（从工程文件打开的覆盖原来的 PNG）"""
+        if self.image_path:
+            filepath = self.image_path
+        else:
+            screenshots_dir = get_screenshots_dir()
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"screenshot_{timestamp}.png"
+            filepath = os.path.join(screenshots_dir, filename)
+
+        canvas = self.ensure_canvas()
+        spooled = False
+        if self.spool is not None:
+            try:
+                self.spool.commit(canvas.toImage(), filepath, self.spool_entry)
+                spooled = True
+            except OSError as e:
+                print(f"截图暂存失败，直接保存: {e}")
+        if not spooled:
+            canvas.save(filepath, "PNG")
         print(f"截图已保存到: {filepath}")
 
+        # 工程文件保存失败不影响截图本身
+        try:
+            if self.project_path:
+                update_project_ops(self.project_path, self.ops, filepath)
+            elif self.save_project:
+                project_path = os.path.splitext(filepath)[0] + ".sitm"
+                save_project(project_path, self.pixmap, self.ops, filepath)
+                print(f"工程文件已保存到: {project_path}")
+        except OSError as e:
+            print(f"工程文件保存失败: {e}")
+        if not spooled:
+            self.saved.emit(filepath)
+
         # 显示保存成功提示
         self.show_save_notification(filepath)
         self.close()
 
-    def show_save_notification(self, filepath):
+    def copy_to_clipboard(self):
+        """复制截图到剪贴板"""
+        canvas = self.ensure_canvas()
+        QApplication.clipboard().setPixmap(canvas)
+        print("截图已复制到剪贴板")
+        self.copied.emit(canvas.toImage())
+
+        self.show_save_notification(None, "✓ 已复制到剪贴板")
+        self.close()
+
+    def show_save_notification(self, filepath, text=None):
         """显示保存成功通知"""
         # 创建临时提示窗口
-        notification = QLabel(f"✓ 已保存到:\n{filepath}", self)
+        notification = QLabel(text or f"✓ 已保存到:\n{filepath}", self)
         notification.setStyleSheet("""
             background-color: rgba(76, 175, 80, 230);
             color: white;
@@ -460,17 +1087,1006 @@ class ScreenshotEditor(QMainWindow):
         super().closeEvent(event)
 
 
+class WorkerSignals(QObject):
+    """后台任务的信号（QRunnable 不是 QObject，不能直接发射信号）"""
+    finished = pyqtSignal(object)
+    error = pyqtSignal(str)
+
+
+class Worker(QRunnable):
+    """在 QThreadPool 中执行的后台任务，结果通过信号回到界面线程"""
+
+    def __init__(self, fn, *args, priority=None, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority  # 例如 QThread.IdlePriority
+        self.signals = WorkerSignals()
+
+    def run(self):
+        thread = QThread.currentThread()
+        old_priority = thread.priority()
+        if old_priority == QThread.InheritPriority:
+            old_priority = QThread.NormalPriority
+        if self.priority is not None:
+            thread.setPriority(self.priority)
+
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.signals.error.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+        finally:
+            # 线程池会复用线程，恢复原来的优先级
+            if self.priority is not None:
+                thread.setPriority(old_priority)
+
+
+def qimage_to_array(image):
+    """QImage -> 形状为 (高, 宽) 的 uint32 数组，每个元素为 0xAARRGGBB"""
+    image = image.convertToFormat(QImage.Format_RGB32)
+    ptr = image.constBits()
+    ptr.setsize(image.bytesPerLine() * image.height())
+    pixels = np.frombuffer(ptr, dtype=np.uint32).reshape(image.height(), image.bytesPerLine() // 4)
+    # 复制一份，避免引用已释放的 QImage 内存
+    return pixels[:, :image.width()].copy()
+
+
+def _long_runs(mask, length):
+    """只保留 mask 中沿第 0 维连续长度不小于 length 的部分"""
+    height = mask.shape[0]
+    if height < length:
+        return np.zeros_like(mask)
+
+    # counts[k] = mask[:k] 的累加，窗口 [s, s + length) 全为 True 即为一段长线
+    counts = np.zeros((height + 1,) + mask.shape[1:], dtype=np.int32)
+    np.cumsum(mask, axis=0, dtype=np.int32, out=counts[1:])
+    full = (counts[length:] - counts[:-length]) == length
+
+    # 某个位置只要被任意一个完整窗口覆盖就保留
+    starts = np.zeros((full.shape[0] + 1,) + mask.shape[1:], dtype=np.int32)
+    np.cumsum(full, axis=0, dtype=np.int32, out=starts[1:])
+    rows = np.arange(height)
+    hi = np.minimum(rows, full.shape[0] - 1) + 1
+    lo = np.maximum(rows - length + 1, 0)
+    return (starts[hi] - starts[lo]) > 0
+
+
+def _nearest(sorted_values, value, distance):
+    """在有序数组中二分查找离 value 最近的值，超出 distance 返回 None"""
+    i = int(np.searchsorted(sorted_values, value))
+    best = None
+    for j in (i - 1, i):
+        if 0 <= j < len(sorted_values):
+            candidate = int(sorted_values[j])
+            if abs(candidate - value) <= distance and (best is None or abs(candidate - value) < abs(best - value)):
+                best = candidate
+    return best
+
+
+class EdgeIndex:
+    """截图中强边缘（窗口边框、面板、表格线）的索引，用于区域选择时吸附
+
+    竖直边缘按行存储：第 y 行中所有竖直边缘的 x 坐标（有序）；
+    水平边缘按列存储：第 x 列中所有水平边缘的 y 坐标（有序）。
+    两者都用 CSR 格式（指针数组 + 数据数组），吸附时只需二分查找。
+    坐标均为截图的物理像素，边缘位于两个像素之间，取右侧/下侧像素的坐标。
+    """
+
+    THRESHOLD = 24  # 相邻像素亮度差超过该值视为边缘
+    MIN_RUN = 24    # 边缘至少连续这么长才算“强边缘”
+
+    def __init__(self, width, height, row_ptr, row_xs, col_ptr, col_ys):
+        self.width = width
+        self.height = height
+        self.row_ptr = row_ptr
+        self.row_xs = row_xs
+        self.col_ptr = col_ptr
+        self.col_ys = col_ys
+
+    @classmethod
+    def from_image(cls, image, threshold=THRESHOLD, min_run=MIN_RUN):
+        """对截图做向量化的边缘检测并建立索引（在后台线程中调用）"""
+        pixels = qimage_to_array(image)
+        height, width = pixels.shape
+
+        # 整数近似的亮度
+        luma = (((pixels >> 16) & 0xFF) * 77 + ((pixels >> 8) & 0xFF) * 150
+                + (pixels & 0xFF) * 29) >> 8
+        luma = luma.astype(np.int16)
+
+        # 竖直边缘：左右相邻像素差异大，且沿竖直方向足够长
+        vertical = np.abs(luma[:, 1:] - luma[:, :-1]) > threshold
+        vertical = _long_runs(vertical, min_run)
+
+        # 水平边缘：上下相邻像素差异大，且沿水平方向足够长
+        horizontal = np.abs(luma[1:, :] - luma[:-1, :]) > threshold
+        horizontal = _long_runs(horizontal.T, min_run)  # 转置后按列存储
+
+        # nonzero 按行优先返回，每行内的坐标天然有序
+        rows, xs = np.nonzero(vertical)
+        row_ptr = np.searchsorted(rows, np.arange(height + 1))
+        cols, ys = np.nonzero(horizontal)
+        col_ptr = np.searchsorted(cols, np.arange(width + 1))
+
+        return cls(width, height, row_ptr, (xs + 1).astype(np.int32),
+                   col_ptr, (ys + 1).astype(np.int32))
+
+    def snap_x(self, x, y, distance):
+        """查找 (x, y) 附近最近的竖直边缘 x 坐标，找不到返回 None"""
+        best = None
+        for row in range(max(0, y - distance), min(self.height, y + distance + 1)):
+            xs = self.row_xs[self.row_ptr[row]:self.row_ptr[row + 1]]
+            candidate = _nearest(xs, x, distance)
+            if candidate is not None and (best is None or abs(candidate - x) < abs(best - x)):
+                best = candidate
+        return best
+
+    def snap_y(self, x, y, distance):
+        """查找 (x, y) 附近最近的水平边缘 y 坐标，找不到返回 None"""
+        best = None
+        for col in range(max(0, x - distance), min(self.width, x + distance + 1)):
+            ys = self.col_ys[self.col_ptr[col]:self.col_ptr[col + 1]]
+            candidate = _nearest(ys, y, distance)
+            if candidate is not None and (best is None or abs(candidate - y) < abs(best - y)):
+                best = candidate
+        return best
+
+
+def _rgb15(rgb):
+    """0xRRGGBB -> 每通道 5 位的 15 位颜色键"""
+    return ((rgb >> 9) & 0x7C00) | ((rgb >> 6) & 0x3E0) | ((rgb >> 3) & 0x1F)
+
+
+def build_palette(pixels, max_colors=256):
+    """统计颜色直方图并生成调色板
+
+    颜色数不超过 max_colors 时直接使用全部颜色（无损），返回 (palette, True)；
+    否则按 15 位颜色分桶，取出现最多的 max_colors 个桶的平均色，返回 (palette, False)。
+    palette 为 uint32 数组，每个元素为 0xRRGGBB。
+    """
+    colors, counts = np.unique(pixels & 0xFFFFFF, return_counts=True)
+    if len(colors) <= max_colors:
+        return colors.astype(np.uint32), True
+
+    keys = _rgb15(colors)
+    bucket_counts = np.bincount(keys, weights=counts, minlength=1 << 15)
+    top = np.argsort(bucket_counts)[::-1][:max_colors]
+    top = top[bucket_counts[top] > 0]
+
+    # 每个桶的加权平均色
+    channels = []
+    for shift in (16, 8, 0):
+        sums = np.bincount(keys, weights=((colors >> shift) & 0xFF) * counts, minlength=1 << 15)
+        channels.append(np.round(sums[top] / bucket_counts[top]).astype(np.uint32))
+    palette = (channels[0] << 16) | (channels[1] << 8) | channels[2]
+    return palette, False
+
+
+class PaletteMapper:
+    """把像素映射为固定调色板的索引，可跨帧复用，避免每帧重新量化"""
+
+    def __init__(self, palette, exact):
+        self.palette = palette
+        self.exact = exact
+        self.order = np.argsort(palette)
+        self.sorted_palette = palette[self.order]
+        self.lut = None
+
+    def map(self, pixels):
+        """返回与 pixels 同形状的 uint8 索引数组
+
+        精确调色板遇到调色板以外的颜色时返回 None，由调用方决定是否重建调色板；
+        非精确调色板用 15 位查找表映射到最近的颜色。
+        """
+        rgb = pixels & 0xFFFFFF
+        if self.exact:
+            pos = np.minimum(np.searchsorted(self.sorted_palette, rgb), len(self.sorted_palette) - 1)
+            if not np.array_equal(self.sorted_palette[pos], rgb):
+                return None
+            return self.order[pos].astype(np.uint8)
+        return self._nearest_lut()[_rgb15(rgb)]
+
+    def _nearest_lut(self):
+        """15 位颜色 -> 最近调色板索引的查找表（首次使用时生成）"""
+        if self.lut is None:
+            keys = np.arange(1 << 15, dtype=np.int32)
+            centers = np.stack([((keys >> 10) & 0x1F) * 8 + 4,
+                                ((keys >> 5) & 0x1F) * 8 + 4,
+                                (keys & 0x1F) * 8 + 4], axis=1)
+            pal = np.stack([(self.palette >> 16) & 0xFF,
+                            (self.palette >> 8) & 0xFF,
+                            self.palette & 0xFF], axis=1).astype(np.int32)
+            lut = np.empty(1 << 15, dtype=np.uint8)
+            for start in range(0, 1 << 15, 4096):
+                diff = centers[start:start + 4096, None, :] - pal[None, :, :]
+                lut[start:start + 4096] = np.argmin((diff * diff).sum(axis=2), axis=1)
+            self.lut = lut
+        return self.lut
+
+
+def format_size(size):
+    """字节数 -> 便于阅读的字符串"""
+    for unit in ("B", "KB", "MB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+PNG_MAX_ERROR = 8             # 调色板 PNG 允许的最大单通道误差（看不出差别）
+PNG_MAX_SAMPLE_COLORS = 4096  # 抽样颜色数超过该值的（照片、渐变等）直接跳过
+
+
+def _max_channel_error(a, b):
+    """两组 0xAARRGGBB 像素在 R、G、B 通道上的最大差值"""
+    return max(int(np.abs(((a >> shift) & 0xFF).astype(np.int16)
+                          - ((b >> shift) & 0xFF).astype(np.int16)).max())
+               for shift in (16, 8, 0))
+
+
+def optimize_png(path, max_error=PNG_MAX_ERROR):
+    """把截图转换为调色板 PNG 并原子替换原文件
+
+    颜色数不超过 256 时无损转换；超过时用 build_palette 量化到 256 色，
+    每个像素每个通道的误差都不超过 max_error 才转换（界面截图的抗锯齿边缘通常如此）。
+    返回 (路径, 原大小, 新大小)；无法转换或没有变小时新大小等于原大小。
+    """
+    original_size = os.path.getsize(path)
+    image = QImage(path)
+    if image.isNull():
+        raise RuntimeError(f"无法读取图片: {path}")
+    if image.format() == QImage.Format_Indexed8:
+        return path, original_size, original_size
+
+    if image.hasAlphaChannel():
+        alpha = qimage_to_array(image.convertToFormat(QImage.Format_ARGB32)) >> 24
+        if not (alpha == 0xFF).all():
+            return path, original_size, original_size
+
+    pixels = qimage_to_array(image)
+    # 先用抽样快速排除颜色明显过多的图片（照片、渐变等）
+    if len(np.unique(pixels.ravel()[::7])) > PNG_MAX_SAMPLE_COLORS:
+        return path, original_size, original_size
+    palette, exact = build_palette(pixels)
+    indices = PaletteMapper(palette, exact).map(pixels)
+    if not exact and _max_channel_error(palette[indices], pixels) > max_error:
+        return path, original_size, original_size
+
+    height, width = pixels.shape
+    indices = np.ascontiguousarray(indices)
+    indexed = QImage(indices.data, width, height, width, QImage.Format_Indexed8)
+    indexed.setColorTable([0xFF000000 | int(color) for color in palette])
+
+    # 写到同目录的临时文件，校验误差仍在允许范围内后再原子替换
+    temp_path = path + ".tmp"
+    try:
+        if not indexed.save(temp_path, "PNG", 0):
+            raise RuntimeError(f"无法写入: {temp_path}")
+        new_size = os.path.getsize(temp_path)
+        if new_size >= original_size:
+            return path, original_size, original_size
+        saved = qimage_to_array(QImage(temp_path))
+        if (saved.shape != pixels.shape
+                or _max_channel_error(saved, pixels) > (max_error if not exact else 0)):
+            raise RuntimeError("转换后像素误差超出范围，已放弃")
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return path, original_size, new_size
+
+
+def _lzw_compress(data, min_code_size=8):
+    """GIF 变长 LZW 压缩，data 为调色板索引的 bytes"""
+    clear_code = 1 << min_code_size
+    end_code = clear_code + 1
+    code_size = min_code_size + 1
+    overflow = 1 << code_size
+    last_code = end_code  # 最近分配的码
+    table = {}
+
+    out = bytearray()
+    bit_buffer = clear_code
+    bit_count = code_size
+
+    prefix = data[0]
+    for byte in data[1:]:
+        key = (prefix << 8) | byte
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+
+        bit_buffer |= prefix << bit_count
+        bit_count += code_size
+        while bit_count >= 8:
+            out.append(bit_buffer & 0xFF)
+            bit_buffer >>= 8
+            bit_count -= 8
+        prefix = byte
+
+        last_code += 1
+        if last_code == overflow:
+            code_size += 1
+            overflow <<= 1
+        if last_code == 4095:
+            # 码表已满，发送清除码重新开始
+            bit_buffer |= clear_code << bit_count
+            bit_count += code_size
+            code_size = min_code_size + 1
+            overflow = 1 << code_size
+            last_code = end_code
+            table = {}
+            continue
+        table[key] = last_code
+
+    # 最后一个前缀和结束码
+    bit_buffer |= prefix << bit_count
+    bit_count += code_size
+    last_code += 1
+    if last_code == overflow:
+        code_size += 1
+    bit_buffer |= end_code << bit_count
+    bit_count += code_size
+    while bit_count > 0:
+        out.append(bit_buffer & 0xFF)
+        bit_buffer >>= 8
+        bit_count -= 8
+    return bytes(out)
+
+
+def _gif_color_table(palette):
+    """调色板 -> 256 色 GIF 颜色表字节"""
+    table = np.zeros(256 * 3, dtype=np.uint8)
+    table[0:len(palette) * 3:3] = (palette >> 16) & 0xFF
+    table[1:len(palette) * 3:3] = (palette >> 8) & 0xFF
+    table[2:len(palette) * 3:3] = palette & 0xFF
+    return table.tobytes()
+
+
+class GifWriter:
+    """动画 GIF 写入器：调色板跨帧复用，每帧只写变化的矩形"""
+
+    def __init__(self, path, width, height, palette):
+        self.file = open(path, "wb")
+        self.width = width
+        self.height = height
+        self.delay_offset = None
+
+        self.file.write(b"GIF89a")
+        self.file.write(struct.pack("<HHBBB", width, height, 0xF7, 0, 0))  # 256 色全局调色板
+        self.file.write(_gif_color_table(palette))
+        # NETSCAPE2.0 扩展：无限循环
+        self.file.write(b"\x21\xFF\x0BNETSCAPE2.0\x03\x01\x00\x00\x00")
+
+    def add_frame(self, indices, x, y, delay_ms=100, palette=None):
+        """写入一帧；indices 为变化矩形内的 uint8 调色板索引
+
+        palette 不为空时作为该帧的局部调色板写入（之后的帧仍由调用方决定用哪个）。
+        """
+        height, width = indices.shape
+        # 图形控制扩展：处置方式 1（保留上一帧），后续帧在其上叠加
+        self.file.write(b"\x21\xF9\x04\x04")
+        self.delay_offset = self.file.tell()
+        self.file.write(struct.pack("<HBB", self._delay(delay_ms), 0, 0))
+
+        flags = 0x87 if palette is not None else 0
+        self.file.write(struct.pack("<BHHHHB", 0x2C, x, y, width, height, flags))
+        if palette is not None:
+            self.file.write(_gif_color_table(palette))
+
+        self.file.write(b"\x08")
+        data = _lzw_compress(np.ascontiguousarray(indices).tobytes())
+        for i in range(0, len(data), 255):
+            block = data[i:i + 255]
+            self.file.write(bytes([len(block)]) + block)
+        self.file.write(b"\x00")
+
+    def set_last_delay(self, delay_ms):
+        """下一帧到来后才知道上一帧的显示时长，回填上一帧的延迟"""
+        if self.delay_offset is None:
+            return
+        end = self.file.tell()
+        self.file.seek(self.delay_offset)
+        self.file.write(struct.pack("<H", self._delay(delay_ms)))
+        self.file.seek(end)
+
+    @staticmethod
+    def _delay(delay_ms):
+        """GIF 延迟单位为 1/100 秒，小于 2 时很多浏览器会当作 10 处理"""
+        return max(2, round(delay_ms / 10))
+
+    def close(self):
+        self.file.write(b"\x3B")
+        self.file.close()
+
+
+def _png_chunk(chunk_type, data):
+    """组装一个 PNG 数据块（长度 + 类型 + 数据 + CRC）"""
+    return (struct.pack(">I", len(data)) + chunk_type + data
+            + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+
+def _png_chunks(data):
+    """解析 PNG 文件，返回 [(类型, 数据), ...]"""
+    chunks = []
+    pos = 8
+    while pos < len(data):
+        length, = struct.unpack(">I", data[pos:pos + 4])
+        chunks.append((data[pos + 4:pos + 8], data[pos + 8:pos + 8 + length]))
+        pos += 12 + length
+    return chunks
+
+
+def _encode_png(pixels):
+    """用 Qt 把 (高, 宽) uint32 像素数组编码为 PNG 字节"""
+    pixels = np.ascontiguousarray(pixels)
+    height, width = pixels.shape
+    image = QImage(pixels.data, width, height, width * 4, QImage.Format_RGB32)
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    image.save(buffer, "PNG")
+    return bytes(data)
+
+
+class ApngWriter:
+    """APNG 写入器：每帧用 Qt 编码为 PNG 后取出 IDAT，只写变化的矩形"""
+
+    def __init__(self, path, width, height):
+        self.file = open(path, "wb")
+        self.width = width
+        self.height = height
+        self.sequence = 0
+        self.frame_count = 0
+        self.actl_offset = None
+        self.last_fctl = None  # (文件偏移, fcTL 数据)
+
+    def add_frame(self, pixels, x, y, delay_ms=100):
+        """写入一帧；pixels 为变化矩形内的 uint32 像素"""
+        height, width = pixels.shape
+        chunks = _png_chunks(_encode_png(pixels))
+        idat = [data for chunk_type, data in chunks if chunk_type == b"IDAT"]
+
+        if self.frame_count == 0:
+            # 第一帧必须是完整画面，沿用它的 IHDR
+            ihdr = next(data for chunk_type, data in chunks if chunk_type == b"IHDR")
+            self.file.write(b"\x89PNG\r\n\x1a\n")
+            self.file.write(_png_chunk(b"IHDR", ihdr))
+            self.actl_offset = self.file.tell()
+            self.file.write(_png_chunk(b"acTL", struct.pack(">II", 0, 0)))  # 帧数在关闭时回填
+
+        # 处置方式 0（保留），混合方式 0（直接覆盖）
+        fctl = struct.pack(">IIIIIHHBB", self.sequence, width, height, x, y,
+                           max(1, int(delay_ms)), 1000, 0, 0)
+        self.last_fctl = (self.file.tell(), fctl)
+        self.file.write(_png_chunk(b"fcTL", fctl))
+        self.sequence += 1
+
+        for data in idat:
+            if self.frame_count == 0:
+                self.file.write(_png_chunk(b"IDAT", data))
+            else:
+                self.file.write(_png_chunk(b"fdAT", struct.pack(">I", self.sequence) + data))
+                self.sequence += 1
+        self.frame_count += 1
+
+    def set_last_delay(self, delay_ms):
+        """回填上一帧的显示时长（fcTL 长度固定，连同 CRC 一起重写）"""
+        if self.last_fctl is None:
+            return
+        offset, fctl = self.last_fctl
+        fctl = fctl[:20] + struct.pack(">HH", max(1, int(delay_ms)), 1000) + fctl[24:]
+        end = self.file.tell()
+        self.file.seek(offset)
+        self.file.write(_png_chunk(b"fcTL", fctl))
+        self.file.seek(end)
+
+    def close(self):
+        self.file.write(_png_chunk(b"IEND", b""))
+        if self.actl_offset is not None:
+            self.file.seek(self.actl_offset)
+            self.file.write(_png_chunk(b"acTL", struct.pack(">II", self.frame_count, 0)))
+        self.file.close()
+
+
+def _changed_mask(a, b, tolerance):
+    """逐像素的变化掩码，tolerance 为每个通道允许的差值"""
+    if tolerance <= 0:
+        return a != b
+    changed = np.zeros(a.shape, dtype=bool)
+    for shift in (16, 8, 0):
+        channel_a = ((a >> shift) & 0xFF).astype(np.int16)
+        channel_b = ((b >> shift) & 0xFF).astype(np.int16)
+        changed |= np.abs(channel_a - channel_b) > tolerance
+    return changed
+
+
+def _tile_flags(column_changed, tile):
+    """一条分块行中每列是否有变化 -> 每个分块是否有变化"""
+    return np.logical_or.reduceat(column_changed, np.arange(0, len(column_changed), tile))
+
+
+def diff_regions(before, after, tile=32, tolerance=0):
+    """比较两张截图的像素数组，返回变化区域列表 [(x, y, 宽, 高), ...]
+
+    按 tile 行一条一条比较，完全相同的分块行直接跳过；
+    有变化的分块行再按 tile x tile 分块，只对有像素不同的分块计算容差。
+    相邻的变化分块合并为一个区域，再在区域内按像素收紧边界。
+    tolerance 为每个通道允许的差值，0 表示必须完全相同。
+    """
+    height = min(before.shape[0], after.shape[0])
+    width = min(before.shape[1], after.shape[1])
+    a = before[:height, :width]
+    b = after[:height, :width]
+
+    rows = -(-height // tile)
+    cols = -(-width // tile)
+    tiles = np.zeros((rows, cols), dtype=bool)
+    for row in range(rows if width > 0 else 0):
+        y0, y1 = row * tile, min((row + 1) * tile, height)
+        column_changed = (a[y0:y1] != b[y0:y1]).any(axis=0)
+        if not column_changed.any():
+            continue
+        flags = _tile_flags(column_changed, tile)
+        if tolerance > 0:
+            # 只在有像素不同的分块范围内计算各通道的差值
+            changed_cols = np.flatnonzero(flags)
+            first, last = int(changed_cols[0]), int(changed_cols[-1]) + 1
+            x0, x1 = first * tile, min(last * tile, width)
+            column_changed = _changed_mask(a[y0:y1, x0:x1], b[y0:y1, x0:x1], tolerance).any(axis=0)
+            flags = np.zeros(cols, dtype=bool)
+            flags[first:last] = _tile_flags(column_changed, tile)
+        tiles[row] = flags
+
+    regions = []
+    if tiles.any():
+        # 8 连通合并相邻的变化分块
+        visited = np.zeros_like(tiles)
+        for start_row, start_col in zip(*np.nonzero(tiles)):
+            if visited[start_row, start_col]:
+                continue
+            visited[start_row, start_col] = True
+            stack = [(start_row, start_col)]
+            top, bottom, left, right = start_row, start_row, start_col, start_col
+            while stack:
+                row, col = stack.pop()
+                top, bottom = min(top, row), max(bottom, row)
+                left, right = min(left, col), max(right, col)
+                for r in range(max(0, row - 1), min(rows, row + 2)):
+                    for c in range(max(0, col - 1), min(cols, col + 2)):
+                        if tiles[r, c] and not visited[r, c]:
+                            visited[r, c] = True
+                            stack.append((r, c))
+
+            # 只在合并后的区域内计算逐像素的变化，收紧边界
+            y0, x0 = int(top) * tile, int(left) * tile
+            y1, x1 = (int(bottom) + 1) * tile, (int(right) + 1) * tile
+            block = _changed_mask(a[y0:y1, x0:x1], b[y0:y1, x0:x1], tolerance)
+            ys = np.flatnonzero(block.any(axis=1))
+            xs = np.flatnonzero(block.any(axis=0))
+            regions.append((x0 + int(xs[0]), y0 + int(ys[0]),
+                            int(xs[-1] - xs[0]) + 1, int(ys[-1] - ys[0]) + 1))
+
+    # 尺寸不同时，新截图多出来的部分整体算作变化
+    if after.shape[1] > width:
+        regions.append((width, 0, after.shape[1] - width, after.shape[0]))
+    if after.shape[0] > height:
+        regions.append((0, height, width, after.shape[0] - height))
+    return regions
+
+
+def compare_screenshots(before_path, after_path, tolerance=0):
+    """读取两张截图并比较，返回 (新截图路径, 变化区域列表, 用时毫秒)"""
+    start = time.perf_counter()
+    arrays = []
+    for path in (before_path, after_path):
+        image = QImage(path)
+        if image.isNull():
+            raise RuntimeError(f"无法读取图片: {path}")
+        arrays.append(qimage_to_array(image))
+    regions = diff_regions(arrays[0], arrays[1], tolerance=tolerance)
+    return after_path, regions, (time.perf_counter() - start) * 1000
+
+
+BATCH_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".webp")
+BATCH_FORMATS = {"png": ".png", "jpg": ".jpg", "webp": ".webp", "bmp": ".bmp"}
+BATCH_MANIFEST = ".batch_manifest.json"
+
+
+def parse_batch_op(spec):
+    """解析批处理操作，返回可以传给子进程的元组
+
+    resize:50%  resize:1280x720（等比缩放到框内）  resize:1280x  resize:x720
+    crop:x,y,w,h  redact:x,y,w,h（涂黑）  stamp:文字（可用 {time} {name}）
+    """
+    name, _, value = spec.partition(":")
+    name = name.strip().lower()
+    if name == "resize":
+        if value.endswith("%"):
+            scale = float(value[:-1]) / 100
+            if scale <= 0:
+                raise ValueError(f"缩放比例必须大于 0: {spec}")
+            return ("resize", scale, 0, 0)
+        width, sep, height = value.lower().partition("x")
+        if not sep or not (width or height):
+            raise ValueError(f"无法解析的尺寸: {spec}")
+        return ("resize", 0, int(width or 0), int(height or 0))
+    if name in ("crop", "redact"):
+        numbers = [int(part) for part in value.split(",")]
+        if len(numbers) != 4 or numbers[2] <= 0 or numbers[3] <= 0:
+            raise ValueError(f"需要 x,y,宽,高: {spec}")
+        return (name, *numbers)
+    if name == "stamp":
+        if not value:
+            raise ValueError("stamp 需要文字")
+        return ("stamp", value)
+    raise ValueError(f"未知操作: {name}（支持 resize、crop、redact、stamp）")
+
+
+_batch_app = None
+
+
+def _batch_init():
+    """子进程初始化：绘制文字需要 QGuiApplication，用 offscreen 平台创建"""
+    global _batch_app
+    os.environ["QT_QPA_PLATFORM"] = "offscreen"
+    _batch_app = QGuiApplication.instance() or QGuiApplication(sys.argv[:1])
+
+
+def _apply_batch_op(image, op, source_path):
+    """对 QImage 执行一个操作，返回新的 QImage"""
+    name = op[0]
+    if name == "resize":
+        _, scale, width, height = op
+        if scale:
+            width = max(1, round(image.width() * scale))
+            height = max(1, round(image.height() * scale))
+            return image.scaled(width, height, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        if width and height:
+            return image.scaled(width, height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        if width:
+            return image.scaledToWidth(width, Qt.SmoothTransformation)
+        return image.scaledToHeight(height, Qt.SmoothTransformation)
+
+    if name == "crop":
+        rect = QRect(*op[1:]).intersected(image.rect())
+        if rect.isEmpty():
+            raise ValueError(f"裁剪区域在图片外: {op[1:]}")
+        return image.copy(rect)
+
+    painter = QPainter(image)
+    try:
+        if name == "redact":
+            painter.fillRect(QRect(*op[1:]), Qt.black)
+        elif name == "stamp":
+            taken = datetime.fromtimestamp(os.path.getmtime(source_path))
+            text = op[1].replace("{time}", taken.strftime("%Y-%m-%d %H:%M:%S"))
+            text = text.replace("{name}", os.path.basename(source_path))
+            font = QFont()
+            font.setPixelSize(max(12, image.height() // 40))
+            painter.setFont(font)
+            metrics = QFontMetrics(font)
+            padding = font.pixelSize() // 2
+            box = metrics.boundingRect(text).adjusted(-padding, -padding, padding, padding)
+            box.moveBottomRight(QPoint(image.width() - padding, image.height() - padding))
+            painter.fillRect(box, QColor(0, 0, 0, 150))
+            painter.setPen(Qt.white)
+            painter.drawText(box, Qt.AlignCenter, text)
+    finally:
+        painter.end()
+    return image
+
+
+def _batch_process(source_path, target_path, ops, quality):
+    """在子进程中处理一张图片，返回 (源路径, 源文件哈希, 原大小, 新大小, 用时毫秒)"""
+    start = time.perf_counter()
+    with open(source_path, "rb") as f:
+        data = f.read()
+    image = QImage.fromData(data)
+    if image.isNull():
+        raise RuntimeError(f"无法读取图片: {source_path}")
+    image = image.convertToFormat(QImage.Format_ARGB32)
+    for op in ops:
+        image = _apply_batch_op(image, op, source_path)
+
+    extension = os.path.splitext(target_path)[1].lower()
+    if extension in (".jpg", ".jpeg", ".bmp"):
+        # 不支持透明的格式：透明部分铺白色
+        opaque = QImage(image.size(), QImage.Format_RGB32)
+        opaque.fill(Qt.white)
+        painter = QPainter(opaque)
+        painter.drawImage(0, 0, image)
+        painter.end()
+        image = opaque
+
+    # 先写临时文件再替换，中途中断不会留下半张图
+    temp_path = target_path + ".tmp"
+    try:
+        if not image.save(temp_path, extension.lstrip(".").upper(), quality):
+            raise RuntimeError(f"无法写入: {target_path}")
+        os.replace(temp_path, target_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return (source_path, hashlib.sha256(data).hexdigest(), len(data),
+            os.path.getsize(target_path), (time.perf_counter() - start) * 1000)
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def run_batch(source_dir, output_dir, ops, fmt="keep", quality=-1, jobs=None, force=False):
+    """用进程池批量处理目录中的截图，边完成边输出结果，返回是否全部成功
+
+    输出目录中的清单记录每个源文件的修改时间、大小、哈希和操作参数，
+    再次运行时跳过没有变化的文件；修改时间变了但内容相同的文件只重新校验哈希
+    （戳记带 {time} 时除外，输出里的时间需要更新）。
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    source_dir = os.path.abspath(source_dir)
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, BATCH_MANIFEST)
+    manifest = {}
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    signature = json.dumps([ops, fmt, quality])
+
+    def save_manifest():
+        temp_path = manifest_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, manifest_path)
+
+    # 先确定每个源文件的输出文件名：a.png 和 a.jpg 转换格式后都会变成 a.png，
+    # 同名的一组都改用 a_png.png、a_jpg.png，避免互相覆盖（按不区分大小写比较）
+    sources = []
+    for name in sorted(os.listdir(source_dir)):
+        source_path = os.path.join(source_dir, name)
+        stem, extension = os.path.splitext(name)
+        if extension.lower() not in BATCH_EXTENSIONS or not os.path.isfile(source_path):
+            continue
+        target_extension = BATCH_FORMATS[fmt] if fmt != "keep" else extension
+        sources.append((name, source_path, stem, extension, target_extension))
+    claims = {}
+    for name, _, stem, _, target_extension in sources:
+        claims.setdefault((stem + target_extension).lower(), []).append(name)
+
+    targets = {}
+    for name, source_path, stem, extension, target_extension in sources:
+        if len(claims[(stem + target_extension).lower()]) > 1:
+            targets[name] = f"{stem}_{extension.lstrip('.')}{target_extension}"
+        else:
+            targets[name] = stem + target_extension
+    claims = {}
+    for name, target_name in targets.items():
+        claims.setdefault(target_name.lower(), []).append(name)
+
+    tasks = []
+    skipped = collided = 0
+    # 戳记带 {time} 时输出依赖源文件的修改时间，修改时间变了就必须重新生成
+    uses_time = any(op[0] == "stamp" and "{time}" in op[1] for op in ops)
+    for name, source_path, stem, extension, target_extension in sources:
+        target_name = targets[name]
+        if len(claims[target_name.lower()]) > 1:
+            collided += 1
+            print(f"{name} 失败: 输出文件名 {target_name} 与 "
+                  f"{'、'.join(other for other in claims[target_name.lower()] if other != name)} 冲突")
+            continue
+        if target_name != stem + target_extension:
+            print(f"{name} -> {target_name}（与同名文件区分）")
+        target_path = os.path.join(output_dir, target_name)
+        if os.path.abspath(source_path) == target_path:
+            continue
+
+        stat = os.stat(source_path)
+        entry = manifest.get(name)
+        if (entry and entry["ops"] == signature and os.path.exists(target_path)
+                and entry.get("output") == target_name):
+            if entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+                skipped += 1
+                continue
+            if (not uses_time and entry["size"] == stat.st_size
+                    and entry["sha256"] == _file_sha256(source_path)):
+                entry["mtime"] = stat.st_mtime
+                skipped += 1
+                continue
+        tasks.append((name, source_path, target_path, stat))
+
+    total = len(tasks)
+    print(f"{source_dir}: 待处理 {total} 张，跳过 {skipped} 张（未变化）")
+    start = time.perf_counter()
+    done = failed = 0
+    if tasks:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_batch_init) as executor:
+            futures = {executor.submit(_batch_process, source_path, target_path, ops, quality):
+                       (name, target_path, stat)
+                       for name, source_path, target_path, stat in tasks}
+            for future in as_completed(futures):
+                name, target_path, stat = futures[future]
+                try:
+                    _, digest, original_size, new_size, ms = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"[{done + failed}/{total}] {name} 失败: {e}")
+                    continue
+                done += 1
+                manifest[name] = {"mtime": stat.st_mtime, "size": stat.st_size,
+                                  "sha256": digest, "ops": signature,
+                                  "output": os.path.basename(target_path)}
+                print(f"[{done + failed}/{total}] {name} -> {os.path.basename(target_path)} "
+                      f"({format_size(original_size)} -> {format_size(new_size)}, {ms:.0f} ms)")
+                # 定期保存清单，中途中断时已完成的文件下次不再重复处理
+                if done % 50 == 0:
+                    save_manifest()
+    save_manifest()
+    failed += collided
+
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed > 0 else 0
+    print(f"完成 {done} 张，失败 {failed} 张，跳过 {skipped} 张，"
+          f"用时 {elapsed:.2f} 秒，{rate:.1f} 张/秒")
+    return failed == 0
+
+
+class MagnifierLoupe:
+    """放大镜：跟随触摸点显示放大的像素网格、坐标和颜色
+
+    只从缓存的截图中采样触摸点周围的一小块像素，
+    并且只需要重绘放大镜自身所在的矩形区域。
+    """
+
+    INFO_HEIGHT = 44  # 网格下方信息栏高度
+    OFFSET = 30       # 与触摸点的距离，避免被手指遮挡
+
+    def __init__(self, image, device_pixel_ratio=1.0, sample_size=15, zoom=9):
+        self.image = image
+        self.ratio = device_pixel_ratio
+        self.sample_size = sample_size
+        self.zoom = zoom
+        self.pos = None
+        self.rect = QRect()
+
+    def grid_size(self):
+        """放大网格的边长（逻辑像素）"""
+        return self.sample_size * self.zoom
+
+    def move_to(self, pos, bounds):
+        """移动到触摸点附近，返回需要重绘的矩形（新旧位置的并集）"""
+        old_rect = QRect(self.rect)
+        self.pos = QPoint(pos)
+        self.rect = self._place(pos, bounds)
+        return old_rect.united(self.rect)
+
+    def hide(self):
+        """隐藏放大镜，返回需要重绘的矩形"""
+        old_rect = QRect(self.rect)
+        self.pos = None
+        self.rect = QRect()
+        return old_rect
+
+    def _place(self, pos, bounds):
+        """计算放大镜位置：默认在触摸点左上方，靠近边缘时翻转"""
+        width = self.grid_size()
+        height = self.grid_size() + self.INFO_HEIGHT
+
+        x = pos.x() - width - self.OFFSET
+        y = pos.y() - height - self.OFFSET
+        if x < bounds.left():
+            x = pos.x() + self.OFFSET
+        if y < bounds.top():
+            y = pos.y() + self.OFFSET
+
+        # 限制在屏幕范围内
+        x = max(bounds.left(), min(x, bounds.right() - width))
+        y = max(bounds.top(), min(y, bounds.bottom() - height))
+        return QRect(x, y, width, height)
+
+    def pixel_at(self, pos):
+        """逻辑坐标 -> 截图中的物理像素坐标"""
+        return int(pos.x() * self.ratio), int(pos.y() * self.ratio)
+
+    def paint(self, painter):
+        """在当前位置绘制放大镜"""
+        if self.pos is None:
+            return
+
+        size = self.grid_size()
+        half = self.sample_size // 2
+        px, py = self.pixel_at(self.pos)
+
+        # 只采样触摸点周围的小窗口（超出截图的部分为透明）
+        sample = self.image.copy(px - half, py - half, self.sample_size, self.sample_size)
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, False)
+
+        # 背景和放大的像素（最近邻缩放，保持像素边界清晰）
+        painter.fillRect(self.rect, QColor(0, 0, 0, 200))
+        grid_rect = QRect(self.rect.left(), self.rect.top(), size, size)
+        painter.drawImage(grid_rect, sample)
+
+        # 像素网格线
+        painter.setPen(QPen(QColor(255, 255, 255, 40), 1))
+        for i in range(1, self.sample_size):
+            offset = i * self.zoom
+            painter.drawLine(grid_rect.left() + offset, grid_rect.top(),
+                             grid_rect.left() + offset, grid_rect.bottom())
+            painter.drawLine(grid_rect.left(), grid_rect.top() + offset,
+                             grid_rect.right(), grid_rect.top() + offset)
+
+        # 高亮中心像素
+        painter.setPen(QPen(QColor(0, 255, 255), 2))
+        painter.setBrush(Qt.NoBrush)
+        painter.drawRect(grid_rect.left() + half * self.zoom, grid_rect.top() + half * self.zoom,
+                         self.zoom, self.zoom)
+
+        # 坐标和颜色信息
+        if self.image.valid(px, py):
+            color = self.image.pixelColor(px, py)
+        else:
+            color = QColor(0, 0, 0)
+        swatch = QRect(self.rect.left() + 6, grid_rect.bottom() + 8, 28, 28)
+        painter.fillRect(swatch, color)
+        painter.setPen(QPen(Qt.white, 1))
+        painter.drawRect(swatch)
+
+        font = painter.font()
+        font.setPointSize(9)
+        painter.setFont(font)
+        text_x = swatch.right() + 8
+        painter.drawText(text_x, swatch.top() + 11, f"({px}, {py})")
+        painter.drawText(text_x, swatch.bottom() - 1, color.name().upper())
+
+        # 外边框
+        painter.setPen(QPen(QColor(0, 255, 255), 2))
+        painter.drawRect(self.rect.adjusted(1, 1, -1, -1))
+        painter.restore()
+
+
 class RegionSelector(QWidget):
     """区域选择窗口"""
     region_selected = pyqtSignal(QRect)
 
-    def __init__(self, screen_pixmap):
+    SELECTION_MARGIN = 8  # 选择框边框和四角标记超出选择区域的范围
+    SNAP_DISTANCE = 8     # 边缘吸附距离（逻辑像素）
+
+    def __init__(self, screen_pixmap, hint_text="用手指或触控笔拖动选择截图区域 | 按住此框可移动"):
         super().__init__()
         self.screen_pixmap = screen_pixmap
         self.begin = QPoint()
         self.end = QPoint()
+        self.begin_snapped = (False, False)  # 起点/终点的 x、y 是否吸附到了边缘
+        self.end_snapped = (False, False)
         self.is_selecting = False
 
+        # 缓存截图的 QImage，供放大镜采样像素
+        self.screen_image = screen_pixmap.toImage()
+        self.loupe = MagnifierLoupe(self.screen_image, screen_pixmap.devicePixelRatio())
+
+        # 后台建立边缘索引，完成前拖动不吸附
+        self.snap_enabled = True
+        self.edge_index = None
+        self.edge_worker = Worker(EdgeIndex.from_image, self.screen_image)
+        self.edge_worker.signals.finished.connect(self.on_edge_index_ready)
+        QThreadPool.globalInstance().start(self.edge_worker)
+
+        # 尺寸信息的字体
+        self.size_font = QFont(self.font())
+        self.size_font.setPointSize(12)
+
         self.setWindowTitle("选择截图区域")
         self.setWindowState(Qt.WindowFullScreen)
         self.setWindowFlags(Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint)
@@ -482,7 +2098,7 @@ class RegionSelector(QWidget):
         self.setGeometry(screen)
 
         # 创建可拖动的提示标签
-        self.hint_label = DraggableLabel("用手指或触控笔拖动选择截图区域 | 按住此框可移动", self)
+        self.hint_label = DraggableLabel(hint_text, self)
         self.hint_label.setStyleSheet("""
             background-color: rgba(0, 0, 0, 180);
             color: white;
@@ -521,20 +2137,106 @@ class RegionSelector(QWidget):
         # 放在右上角
         self.cancel_btn.move(screen.width() - self.cancel_btn.width() - 20, 20)
 
+        # 边缘吸附开关按钮（取消按钮左侧）
+        self.snap_btn = QPushButton("🧲 吸附: 开", self)
+        self.snap_btn.setCheckable(True)
+        self.snap_btn.setChecked(True)
+        self.snap_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #607D8B;
+                color: white;
+                border: none;
+                padding: 15px 30px;
+                border-radius: 8px;
+                font-size: 18px;
+                font-weight: bold;
+                min-width: 150px;
+                min-height: 60px;
+            }
+            QPushButton:checked {
+                background-color: #2196F3;
+            }
+        """)
+        self.snap_btn.toggled.connect(self.set_snap_enabled)
+        self.snap_btn.adjustSize()
+        self.snap_btn.move(self.cancel_btn.x() - self.snap_btn.width() - 20, 20)
+
+    def on_edge_index_ready(self, edge_index):
+        """后台边缘索引建立完成"""
+        self.edge_index = edge_index
+
+    def set_snap_enabled(self, enabled):
+        """开启/关闭边缘吸附"""
+        self.snap_enabled = enabled
+        self.snap_btn.setText("🧲 吸附: 开" if enabled else "🧲 吸附: 关")
+
+    def snap_point(self, pos):
+        """把触摸点吸附到附近的强边缘上（只做二分查找，不扫描图像）
+
+        返回 (点, (x 是否吸附, y 是否吸附))
+        """
+        if not self.snap_enabled or self.edge_index is None:
+            return QPoint(pos), (False, False)
+
+        ratio = self.screen_pixmap.devicePixelRatio()
+        x = int(pos.x() * ratio)
+        y = int(pos.y() * ratio)
+        distance = int(self.SNAP_DISTANCE * ratio)
+
+        snapped_x = self.edge_index.snap_x(x, y, distance)
+        snapped_y = self.edge_index.snap_y(x, y, distance)
+        if snapped_x is not None:
+            x = snapped_x
+        if snapped_y is not None:
+            y = snapped_y
+        return (QPoint(round(x / ratio), round(y / ratio)),
+                (snapped_x is not None, snapped_y is not None))
+
+    def _selection_rect(self):
+        """由起点和终点得到选择框
+
+        边缘坐标取的是边缘右侧/下侧的像素，而 QRect 的右边和下边是包含在内的，
+        所以吸附到边缘的右边/下边要减一，否则会多选进边缘外的一个像素。
+        """
+        def span(a, a_snapped, b, b_snapped):
+            (low, _), (high, high_snapped) = sorted([(a, a_snapped), (b, b_snapped)])
+            if high_snapped and high > low:
+                high -= 1
+            return low, high
+
+        left, right = span(self.begin.x(), self.begin_snapped[0],
+                           self.end.x(), self.end_snapped[0])
+        top, bottom = span(self.begin.y(), self.begin_snapped[1],
+                           self.end.y(), self.end_snapped[1])
+        return QRect(QPoint(left, top), QPoint(right, bottom))
+
+    def _end_corner(self):
+        """选择框在终点这一角的像素（与 _selection_rect 一致），放大镜以它为中心"""
+        x, y = self.end.x(), self.end.y()
+        if self.end_snapped[0] and x > self.begin.x():
+            x -= 1
+        if self.end_snapped[1] and y > self.begin.y():
+            y -= 1
+        return QPoint(x, y)
+
     def paintEvent(self, event):
         """绘制半透明遮罩和选择区域"""
         painter = QPainter(self)
         painter.setRenderHint(QPainter.Antialiasing)
 
-        # 绘制原始屏幕截图
-        painter.drawPixmap(0, 0, self.screen_pixmap)
+        # 只绘制需要更新的那部分原始屏幕截图
+        exposed = event.rect()
+        ratio = self.screen_pixmap.devicePixelRatio()
+        source = QRectF(exposed.x() * ratio, exposed.y() * ratio,
+                        exposed.width() * ratio, exposed.height() * ratio)
+        painter.drawPixmap(QRectF(exposed), self.screen_pixmap, source)
 
         # 创建半透明遮罩层
         mask = QColor(0, 0, 0, 120)
 
         if self.is_selecting and self.begin != self.end:
             # 获取选择区域
-            select_rect = QRect(self.begin, self.end).normalized()
+            select_rect = self._selection_rect()
 
             # 绘制四个遮罩区域（选择区域外的部分）
             # 上方
@@ -566,27 +2268,13 @@ class RegionSelector(QWidget):
             # 右下
             painter.drawRect(select_rect.right() - corner_size + 1, select_rect.bottom() - corner_size + 1, corner_size, corner_size)
 
-            # 显示尺寸信息
+            # 显示尺寸信息（显示在选择框右下角外侧）
             size_text = f"{select_rect.width()} x {select_rect.height()}"
-            font = painter.font()
-            font.setPointSize(12)
-            painter.setFont(font)
-
-            # 计算文字位置（显示在选择框右下角外侧）
-            text_rect = painter.fontMetrics().boundingRect(size_text)
-            text_x = select_rect.right() - text_rect.width() - 5
-            text_y = select_rect.bottom() + text_rect.height() + 5
-
-            # 如果超出屏幕，调整位置
-            if text_y + text_rect.height() > self.height():
-                text_y = select_rect.bottom() - 5
-            if text_x < 0:
-                text_x = select_rect.left() + 5
+            painter.setFont(self.size_font)
+            text_x, text_y, text_bg = self._size_label_geometry(select_rect)
 
             # 绘制文字背景
-            painter.fillRect(text_x - 3, text_y - text_rect.height() - 3,
-                           text_rect.width() + 6, text_rect.height() + 6,
-                           QColor(0, 0, 0, 150))
+            painter.fillRect(text_bg, QColor(0, 0, 0, 150))
 
             # 绘制文字
             painter.setPen(Qt.white)
@@ -595,28 +2283,68 @@ class RegionSelector(QWidget):
             # 没有选择时，全屏遮罩
             painter.fillRect(self.rect(), mask)
 
+        # 绘制放大镜
+        self.loupe.paint(painter)
+
+    def _size_label_geometry(self, select_rect):
+        """计算尺寸信息的文字位置和背景矩形"""
+        size_text = f"{select_rect.width()} x {select_rect.height()}"
+        text_rect = QFontMetrics(self.size_font).boundingRect(size_text)
+        text_x = select_rect.right() - text_rect.width() - 5
+        text_y = select_rect.bottom() + text_rect.height() + 5
+
+        # 如果超出屏幕，调整位置
+        if text_y + text_rect.height() > self.height():
+            text_y = select_rect.bottom() - 5
+        if text_x < 0:
+            text_x = select_rect.left() + 5
+
+        text_bg = QRect(text_x - 3, text_y - text_rect.height() - 3,
+                        text_rect.width() + 6, text_rect.height() + 6)
+        return text_x, text_y, text_bg
+
+    def _selection_region(self):
+        """当前选择框（含边框、四角标记和尺寸信息）占用的区域"""
+        if not (self.is_selecting and self.begin != self.end):
+            return QRegion()
+        select_rect = self._selection_rect()
+        margin = self.SELECTION_MARGIN
+        region = QRegion(select_rect.adjusted(-margin, -margin, margin, margin))
+        _, _, text_bg = self._size_label_geometry(select_rect)
+        return region.united(QRegion(text_bg.adjusted(-1, -1, 1, 1)))
+
     def mousePressEvent(self, event):
         """鼠标/触摸按下 - 开始选择"""
         if event.button() == Qt.LeftButton:
-            # 检查是否点击在取消按钮区域
-            if self.cancel_btn.geometry().contains(event.pos()):
+            # 检查是否点击在取消按钮或吸附按钮区域
+            if (self.cancel_btn.geometry().contains(event.pos())
+                    or self.snap_btn.geometry().contains(event.pos())):
                 return
-            self.begin = event.pos()
-            self.end = event.pos()
+            self.begin, self.begin_snapped = self.snap_point(event.pos())
+            self.end, self.end_snapped = QPoint(self.begin), self.begin_snapped
             self.is_selecting = True
+            # 放大镜显示吸附后的点，而不是手指的位置
+            self.loupe.move_to(self.begin, self.rect())
             self.update()
 
     def mouseMoveEvent(self, event):
-        """鼠标/触摸移动 - 更新选择区域"""
+        """鼠标/触摸移动 - 更新选择区域
+
+        只重绘选择框和放大镜新旧位置覆盖的区域，避免每次移动都重绘整个屏幕
+        """
         if self.is_selecting:
-            self.end = event.pos()
-            self.update()
+            dirty = self._selection_region()
+            self.end, self.end_snapped = self.snap_point(event.pos())
+            dirty = dirty.united(self._selection_region())
+            dirty = dirty.united(QRegion(self.loupe.move_to(self._end_corner(), self.rect())))
+            self.update(dirty)
 
     def mouseReleaseEvent(self, event):
         """鼠标/触摸释放 - 完成选择"""
         if event.button() == Qt.LeftButton and self.is_selecting:
             self.is_selecting = False
-            rect = QRect(self.begin, self.end).normalized()
+            self.update(self.loupe.hide())
+            rect = self._selection_rect()
 
             # 区域太小则取消
             if rect.width() < 10 or rect.height() < 10:
@@ -632,6 +2360,1056 @@ class RegionSelector(QWidget):
             self.close()
 
 
+class FrameRingBuffer:
+    """有界环形缓冲区：采集线程写入，编码线程读取，写满时覆盖最旧的帧"""
+
+    def __init__(self, capacity):
+        self.frames = deque(maxlen=capacity)
+        self.condition = threading.Condition()
+        self.closed = False
+        self.overwritten = 0  # 被覆盖（丢弃）的帧数
+
+    def push(self, frame):
+        with self.condition:
+            if len(self.frames) == self.frames.maxlen:
+                self.overwritten += 1
+            self.frames.append(frame)
+            self.condition.notify()
+
+    def pop(self):
+        """取出最旧的帧；缓冲区已关闭且为空时返回 None"""
+        with self.condition:
+            while not self.frames and not self.closed:
+                self.condition.wait()
+            return self.frames.popleft() if self.frames else None
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def __len__(self):
+        return len(self.frames)
+
+
+class RecordingStats:
+    """录屏流水线的计数器（采集线程和编码线程各自只写自己的字段）"""
+
+    def __init__(self):
+        self.captured = 0   # 已采集帧数
+        self.missed = 0     # 定时器没赶上而漏采的帧数
+        self.encoded = 0    # 已编码帧数（含无变化而跳过的帧）
+        self.written = 0    # 实际写入文件的帧数
+        self.lag_ms = 0.0   # 最近一帧从采集到编码完成的延迟
+        self.buffer = None
+
+    @property
+    def dropped(self):
+        overwritten = self.buffer.overwritten if self.buffer is not None else 0
+        return self.missed + overwritten
+
+    def summary(self):
+        pending = len(self.buffer) if self.buffer is not None else 0
+        return (f"采集 {self.captured} | 写入 {self.written} | 丢帧 {self.dropped}\n"
+                f"编码延迟 {self.lag_ms:.0f} ms | 待编码 {pending}")
+
+
+class RecordingEncoder(QThread):
+    """录屏编码线程：与上一帧做差分，只编码变化的矩形"""
+    encoded = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, buffer, path, fmt, stats):
+        super().__init__()
+        self.buffer = buffer
+        self.path = path
+        self.fmt = fmt
+        self.stats = stats
+        self.stop_time = None
+
+    def run(self):
+        temp_path = self.path + ".part"
+        try:
+            written = self._encode(temp_path)
+            if written == 0:
+                raise RuntimeError("没有录到任何画面")
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            self.failed.emit(str(e))
+        else:
+            self.encoded.emit(self.path)
+
+    def _encode(self, path):
+        writer = None
+        mapper = None
+        global_palette = None
+        previous = None
+        last_time = None
+
+        try:
+            while True:
+                frame = self.buffer.pop()
+                if frame is None:
+                    break
+                image, captured_at = frame
+                pixels = qimage_to_array(image)
+
+                if previous is None or previous.shape != pixels.shape:
+                    x, y = 0, 0
+                    height, width = pixels.shape
+                    changed = pixels
+                else:
+                    # 差分：只保留变化像素的包围矩形
+                    diff = pixels != previous
+                    rows = np.flatnonzero(diff.any(axis=1))
+                    if len(rows) == 0:
+                        # 画面没变化，上一帧的显示时间自动延长
+                        self._frame_done(captured_at)
+                        continue
+                    cols = np.flatnonzero(diff.any(axis=0))
+                    y, x = int(rows[0]), int(cols[0])
+                    changed = pixels[y:rows[-1] + 1, x:cols[-1] + 1]
+
+                if writer is None:
+                    height, width = pixels.shape
+                    if self.fmt == "gif":
+                        palette, exact = build_palette(pixels)
+                        mapper = PaletteMapper(palette, exact)
+                        global_palette = palette
+                        writer = GifWriter(path, width, height, palette)
+                    else:
+                        writer = ApngWriter(path, width, height)
+                elif last_time is not None:
+                    writer.set_last_delay((captured_at - last_time) * 1000)
+
+                if self.fmt == "gif":
+                    indices = mapper.map(changed)
+                    if indices is None:
+                        # 出现新颜色：合并旧调色板重建，之后的帧复用新调色板
+                        colors = np.concatenate([mapper.palette, changed.ravel() & 0xFFFFFF])
+                        palette, exact = build_palette(colors)
+                        mapper = PaletteMapper(palette, exact)
+                        indices = mapper.map(changed)
+                    # 调色板与全局颜色表不同时，每一帧都要带上局部颜色表
+                    local_palette = None if mapper.palette is global_palette else mapper.palette
+                    writer.add_frame(indices, x, y, palette=local_palette)
+                else:
+                    writer.add_frame(changed, x, y)
+
+                previous = pixels
+                last_time = captured_at
+                self.stats.written += 1
+                self._frame_done(captured_at)
+
+            if writer is not None and last_time is not None:
+                end_time = self.stop_time if self.stop_time is not None else last_time + 0.1
+                writer.set_last_delay(max(0.02, end_time - last_time) * 1000)
+        finally:
+            if writer is not None:
+                writer.close()
+        return self.stats.written
+
+    def _frame_done(self, captured_at):
+        self.stats.encoded += 1
+        self.stats.lag_ms = (time.monotonic() - captured_at) * 1000
+
+
+class RegionRecorder(QObject):
+    """区域录屏：按目标帧率截取区域画面放入环形缓冲区，由编码线程写成 GIF/APNG"""
+    finished = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+    FPS = 10
+    BUFFER_FRAMES = 32
+    MAX_SECONDS = 60
+
+    def __init__(self, rect, fmt="gif", fps=FPS):
+        super().__init__()
+        self.rect = rect
+        self.fps = fps
+        self.recording = False
+        self.start_time = 0.0
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        extension = "gif" if fmt == "gif" else "png"
+        self.path = os.path.join(get_screenshots_dir(), f"recording_{timestamp}.{extension}")
+
+        self.buffer = FrameRingBuffer(self.BUFFER_FRAMES)
+        self.stats = RecordingStats()
+        self.stats.buffer = self.buffer
+        self.encoder = RecordingEncoder(self.buffer, self.path, fmt, self.stats)
+        self.encoder.encoded.connect(self.finished)
+        self.encoder.failed.connect(self.failed)
+
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.capture_frame)
+
+    def start(self):
+        """开始录制"""
+        self.recording = True
+        self.start_time = time.monotonic()
+        self.encoder.start()
+        self.timer.start(int(1000 / self.fps))
+        self.capture_frame()
+
+    def capture_frame(self):
+        """截取一帧放入缓冲区（在界面线程中执行，只做截取，不做编码）"""
+        now = time.monotonic()
+        elapsed = now - self.start_time
+        if elapsed >= self.MAX_SECONDS:
+            self.stop()
+            return
+
+        screen = QApplication.primaryScreen()
+        pixmap = screen.grabWindow(0, self.rect.x(), self.rect.y(),
+                                   self.rect.width(), self.rect.height())
+        if not pixmap.isNull():
+            self.buffer.push((pixmap.toImage(), now))
+            self.stats.captured += 1
+
+        # 按经过的时间应该采集的帧数，多出来的就是定时器没赶上的帧
+        expected = int(elapsed * self.fps) + 1
+        self.stats.missed = max(self.stats.missed, expected - self.stats.captured)
+
+    def stop(self):
+        """停止录制，编码线程处理完缓冲区剩余的帧后结束"""
+        if not self.recording:
+            return
+        self.recording = False
+        self.timer.stop()
+        self.encoder.stop_time = time.monotonic()
+        self.buffer.close()
+
+
+class RecordingPanel(DraggableWidget):
+    """录屏控制面板：显示流水线计数器和停止按钮"""
+
+    def __init__(self, recorder):
+        super().__init__()
+        self.recorder = recorder
+
+        self.setWindowFlags(Qt.FramelessWindowHint | Qt.WindowStaysOnTopHint | Qt.Tool)
+        self.setAttribute(Qt.WA_StyledBackground, True)
+        self.setStyleSheet("""
+            RecordingPanel {
+                background-color: rgba(40, 40, 40, 230);
+                border-radius: 10px;
+                border: 2px dashed rgba(100, 100, 100, 150);
+            }
+            QLabel {
+                color: white;
+                font-size: 13px;
+            }
+            QPushButton {
+                background-color: #f44336;
+                color: white;
+                border: none;
+                padding: 10px 20px;
+                border-radius: 8px;
+                font-size: 16px;
+                font-weight: bold;
+                min-height: 50px;
+            }
+            QPushButton:pressed {
+                background-color: #c1170a;
+            }
+        """)
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(15, 10, 15, 10)
+        layout.setSpacing(15)
+
+        self.stats_label = QLabel(self.recorder.stats.summary())
+        layout.addWidget(self.stats_label)
+
+        self.stop_btn = QPushButton("⏹ 停止录制")
+        self.stop_btn.clicked.connect(self.stop_recording)
+        layout.addWidget(self.stop_btn)
+
+        self.setLayout(layout)
+        self.adjustSize()
+        self.place_outside(recorder.rect)
+
+        # 定时刷新计数器
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh_stats)
+        self.refresh_timer.start(500)
+
+    def place_outside(self, rect):
+        """尽量放在录制区域外面，避免被录进去"""
+        screen = QApplication.primaryScreen().geometry()
+        x = max(0, min(rect.left(), screen.width() - self.width()))
+        if rect.bottom() + 10 + self.height() <= screen.height():
+            y = rect.bottom() + 10
+        elif rect.top() - 10 - self.height() >= 0:
+            y = rect.top() - 10 - self.height()
+        else:
+            x = screen.width() - self.width() - 20
+            y = 20
+        self.move(x, y)
+
+    def refresh_stats(self):
+        """刷新计数器"""
+        self.stats_label.setText(self.recorder.stats.summary())
+
+    def stop_recording(self):
+        """停止录制，等待编码完成"""
+        self.recorder.stop()
+        self.stop_btn.setEnabled(False)
+        self.stop_btn.setText("编码中…")
+
+
+class InputRecorder(QObject):
+    """输入事件录制器：把编辑窗口/区域选择窗口收到的鼠标（触摸）事件记录到文件
+
+    文件格式：8 字节魔数 + 4 字节 JSON 元数据长度 + JSON 元数据 + 定长二进制记录。
+    截图画面另存为同名 .png，回放时使用同一画面，保证结果可重复。
+    编辑窗口直接处理的触控笔/触摸事件也会记录（带压力），回放时作为触控笔事件发送。
+    工具栏按钮和按键不经过事件过滤器，会改变标注的撤销另外记录。
+    """
+    MAGIC = b"SITMREC2"
+    # 时间（微秒）, 事件类型, x, y, 按键, 按下的按键, 模式, 压力
+    RECORD = struct.Struct("<IBddBBBd")
+    # 旧版本（只有鼠标事件，坐标为整数）
+    MAGIC_V1 = b"SITMREC1"
+    RECORD_V1 = struct.Struct("<IBhhBBB")
+
+    PRESS, MOVE, RELEASE, TOOLBAR_MOVE = 1, 2, 3, 4
+    PEN_PRESS, PEN_MOVE, PEN_RELEASE = 5, 6, 7
+    UNDO = 8
+    EVENT_CODES = {
+        QEvent.MouseButtonPress: PRESS,
+        QEvent.MouseMove: MOVE,
+        QEvent.MouseButtonRelease: RELEASE,
+    }
+    PEN_CODES = {"press": PEN_PRESS, "move": PEN_MOVE, "release": PEN_RELEASE}
+
+    def __init__(self, widget, directory):
+        super().__init__(widget)
+        self.widget = widget
+        self.kind = "editor" if isinstance(widget, ScreenshotEditor) else "selector"
+        self.records = bytearray()
+        self.saved = False
+        self.meta = self.metadata()
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{self.kind}_{timestamp}.sitmrec")
+
+        # 保存截图画面，回放时使用
+        base = widget.pixmap if self.kind == "editor" else widget.screen_pixmap
+        base.save(os.path.splitext(self.path)[0] + ".png", "PNG")
+
+        self.start = time.perf_counter()
+        widget.installEventFilter(self)
+        if self.kind == "editor":
+            # 工具栏可以拖动，位置会影响哪些事件被忽略
+            widget.toolbar.installEventFilter(self)
+            widget.undone.connect(self.on_undo)
+
+    def metadata(self):
+        """回放时需要还原的窗口初始状态"""
+        screen = QApplication.primaryScreen().geometry()
+        meta = {"kind": self.kind, "screen": [screen.width(), screen.height()]}
+        if self.kind == "editor":
+            meta["toolbar"] = list(self.widget.toolbar.geometry().getRect())
+        else:
+            meta["cancel_btn"] = list(self.widget.cancel_btn.geometry().getRect())
+            meta["snap_btn"] = list(self.widget.snap_btn.geometry().getRect())
+        return meta
+
+    def mode(self):
+        """当前模式：编辑窗口为画笔类型，区域选择窗口为是否吸附"""
+        if self.kind == "editor":
+            return 1 if self.widget.draw_mode == "arrow" else 0
+        return 1 if self.widget.snap_enabled else 0
+
+    def eventFilter(self, obj, event):
+        event_type = event.type()
+        if obj is self.widget and event_type in self.EVENT_CODES:
+            # 触摸合成的和高分屏上的鼠标事件坐标带小数，编辑窗口按小数坐标画线
+            self._append(self.EVENT_CODES[event_type], event.localPos(),
+                         int(event.button()), int(event.buttons()))
+        elif (obj is self.widget and self.kind == "editor"
+              and event_type in ScreenshotEditor.PEN_ACTIONS):
+            # 只记录编辑窗口会直接处理的事件，其余的会被转成鼠标事件再记录
+            action = ScreenshotEditor.PEN_ACTIONS[event_type]
+            point = self.widget.pen_point(event)
+            if action == "press":
+                recorded = self.widget.accepts_pen_press(point)
+            elif action == "move":
+                recorded = self.widget.stroke_source == "pen" and point is not None
+            else:
+                recorded = self.widget.stroke_source == "pen"
+            if recorded:
+                if point is None:
+                    point = (QPointF(*self.widget.stroke_cursor[:2]), 0.0)
+                # 笔尖接触屏幕相当于按住左键（触摸事件也这样记录）
+                button = Qt.LeftButton if action != "move" else Qt.NoButton
+                buttons = Qt.LeftButton if action != "release" else Qt.NoButton
+                self._append(self.PEN_CODES[action], point[0], int(button), int(buttons), point[1])
+        elif obj is not self.widget and event_type == QEvent.Move:
+            self._append(self.TOOLBAR_MOVE, event.pos(), 0, 0)
+        elif obj is self.widget and event_type == QEvent.Close:
+            self.save()
+        return False
+
+    def on_undo(self):
+        """编辑窗口撤销了一个标注"""
+        self._append(self.UNDO, QPointF(), 0, 0)
+
+    def _append(self, code, pos, button, buttons, pressure=0.0):
+        elapsed_us = int((time.perf_counter() - self.start) * 1_000_000)
+        self.records += self.RECORD.pack(elapsed_us, code, pos.x(), pos.y(),
+                                         button & 0xFF, buttons & 0xFF, self.mode(), pressure)
+
+    def save(self):
+        """写入录制文件（窗口关闭时调用）"""
+        if self.saved:
+            return
+        self.saved = True
+        meta = json.dumps(self.meta).encode("utf-8")
+        with open(self.path, "wb") as f:
+            f.write(self.MAGIC)
+            f.write(struct.pack("<I", len(meta)))
+            f.write(meta)
+            f.write(self.records)
+        count = len(self.records) // self.RECORD.size
+        print(f"输入事件已录制到: {self.path}（{count} 个事件）")
+
+
+def load_input_recording(path):
+    """读取输入事件录制文件
+
+    返回 (元数据, [(时间秒, 类型, x, y, 按键, 按下的按键, 模式, 压力), ...])，
+    旧版本文件的压力为 0。
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:8] == InputRecorder.MAGIC:
+        record = InputRecorder.RECORD
+    elif data[:8] == InputRecorder.MAGIC_V1:
+        record = InputRecorder.RECORD_V1
+    else:
+        raise ValueError(f"不是输入事件录制文件: {path}")
+    meta_length, = struct.unpack_from("<I", data, 8)
+    meta = json.loads(data[12:12 + meta_length].decode("utf-8"))
+
+    records = []
+    body = data[12 + meta_length:]
+    for fields in record.iter_unpack(body):
+        records.append((fields[0] / 1_000_000,) + fields[1:7] + (fields[7] if len(fields) > 7 else 0.0,))
+    return meta, records
+
+
+def replay_input_recording(path, speed="max"):
+    """在当前 QApplication 中回放输入事件，返回统计报告（需已创建 QApplication）
+
+    speed 为 "original" 时按录制时的时间间隔回放，为 "max" 时尽快回放。
+    每个事件的处理时间包括事件处理函数和随后的重绘。
+    """
+    meta, records = load_input_recording(path)
+    base_path = os.path.splitext(path)[0] + ".png"
+    if os.path.exists(base_path):
+        pixmap = QPixmap(base_path)
+    else:
+        pixmap = QPixmap(*meta["screen"])
+        pixmap.fill(Qt.white)
+
+    selected = []
+    if meta["kind"] == "editor":
+        widget = ScreenshotEditor(pixmap)
+        widget.toolbar.setGeometry(*meta["toolbar"])
+    else:
+        widget = RegionSelector(pixmap)
+        widget.setAttribute(Qt.WA_DeleteOnClose, False)
+        widget.cancel_btn.setGeometry(*meta["cancel_btn"])
+        widget.snap_btn.setGeometry(*meta["snap_btn"])
+        widget.region_selected.connect(selected.append)
+    widget.show()
+    QApplication.processEvents()
+
+    if meta["kind"] == "selector":
+        # 等边缘索引建立完成，保证吸附结果可重复
+        deadline = time.perf_counter() + 30
+        while widget.edge_index is None and time.perf_counter() < deadline:
+            QApplication.processEvents()
+            time.sleep(0.005)
+
+    names = {InputRecorder.PRESS: "按下", InputRecorder.MOVE: "移动",
+             InputRecorder.RELEASE: "释放", InputRecorder.TOOLBAR_MOVE: "工具栏移动",
+             InputRecorder.PEN_PRESS: "笔按下", InputRecorder.PEN_MOVE: "笔移动",
+             InputRecorder.PEN_RELEASE: "笔抬起", InputRecorder.UNDO: "撤销"}
+    timings = {name: [] for name in names.values()}
+    start = time.perf_counter()
+    for elapsed, code, x, y, button, buttons, mode, pressure in records:
+        if speed == "original":
+            delay = start + elapsed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        if code == InputRecorder.TOOLBAR_MOVE:
+            began = time.perf_counter()
+            widget.toolbar.move(int(x), int(y))
+            QApplication.processEvents()
+            timings[names[code]].append(time.perf_counter() - began)
+            continue
+        if code == InputRecorder.UNDO:
+            began = time.perf_counter()
+            widget.undo()
+            QApplication.processEvents()
+            timings[names[code]].append(time.perf_counter() - began)
+            continue
+
+        # 还原模式（工具栏按钮上的点击不会被录制）
+        if meta["kind"] == "editor":
+            if mode == 1 and widget.draw_mode != "arrow":
+                widget.set_arrow_mode()
+            elif mode == 0 and widget.draw_mode != "line":
+                widget.set_line_mode()
+        elif widget.snap_enabled != bool(mode):
+            widget.snap_btn.setChecked(bool(mode))
+
+        pos = QPointF(x, y)
+        global_pos = QPointF(widget.mapToGlobal(pos.toPoint()))
+        if code in (InputRecorder.PEN_PRESS, InputRecorder.PEN_MOVE, InputRecorder.PEN_RELEASE):
+            event_type = {InputRecorder.PEN_PRESS: QEvent.TabletPress,
+                          InputRecorder.PEN_MOVE: QEvent.TabletMove,
+                          InputRecorder.PEN_RELEASE: QEvent.TabletRelease}[code]
+            event = QTabletEvent(event_type, pos, global_pos, QTabletEvent.Stylus,
+                                 QTabletEvent.Pen, pressure, 0, 0, 0.0, 0.0, 0, Qt.NoModifier,
+                                 0, Qt.MouseButton(button), Qt.MouseButtons(buttons))
+        else:
+            event_type = {InputRecorder.PRESS: QEvent.MouseButtonPress,
+                          InputRecorder.MOVE: QEvent.MouseMove,
+                          InputRecorder.RELEASE: QEvent.MouseButtonRelease}[code]
+            event = QMouseEvent(event_type, pos, global_pos,
+                                Qt.MouseButton(button), Qt.MouseButtons(buttons), Qt.NoModifier)
+        began = time.perf_counter()
+        QApplication.sendEvent(widget, event)
+        QApplication.processEvents()
+        timings[names[code]].append(time.perf_counter() - began)
+    total = time.perf_counter() - start
+
+    # 最终结果的哈希：编辑窗口为画布像素，区域选择窗口为选中的区域
+    digest = hashlib.sha256()
+    points = ops = None
+    if meta["kind"] == "editor":
+        ops = widget.ops
+        points = (widget.raw_point_count,
+                  sum(len(op["points"]) for op in widget.ops if op["type"] == "stroke"))
+        canvas = widget.ensure_canvas().toImage()
+        digest.update(struct.pack("<II", canvas.width(), canvas.height()))
+        digest.update(qimage_to_array(canvas).tobytes())
+    else:
+        for rect in selected:
+            digest.update(struct.pack("<iiii", *rect.getRect()))
+    widget.close()
+
+    all_times = sorted(t for values in timings.values() for t in values)
+    return {
+        "kind": meta["kind"],
+        "events": len(all_times),
+        "total_ms": total * 1000,
+        "by_type": {name: values for name, values in timings.items() if values},
+        "all": all_times,
+        "points": points,
+        "ops": ops,
+        "hash": digest.hexdigest(),
+    }
+
+
+def format_replay_report(report, speed):
+    """把回放统计整理成文本"""
+    def describe(values):
+        values = sorted(values)
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        return (f"{len(values)} 个，平均 {sum(values) / len(values) * 1000:.3f} ms，"
+                f"P95 {p95 * 1000:.3f} ms，最大 {values[-1] * 1000:.3f} ms")
+
+    lines = [f"回放 {report['events']} 个事件（{report['kind']}，{speed} 速度），"
+             f"总耗时 {report['total_ms']:.1f} ms"]
+    if report["all"]:
+        lines.append(f"  全部: {describe(report['all'])}")
+        for name, values in report["by_type"].items():
+            lines.append(f"  {name}: {describe(values)}")
+    if report.get("points"):
+        lines.append("笔画点数: 输入 {} 个，简化后保存 {} 个".format(*report["points"]))
+    lines.append(f"最终哈希: {report['hash']}")
+    return "\n".join(lines)
+
+
+class ShareError(Exception):
+    """上传失败；retryable 表示稍后重试可能成功"""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class HttpShareSink:
+    """上传到 HTTP 接口（multipart/form-data POST），复用同一个长连接
+
+    每个上传线程各自持有一个实例，相当于一个大小等于并发数的连接池。
+    其它上传方式只需实现同样的 upload(path) -> 地址 和 close() 即可接入上传队列。
+    """
+    TIMEOUT = 30
+
+    def __init__(self, endpoint, token="", field="file"):
+        self.url = urllib.parse.urlsplit(endpoint)
+        if self.url.scheme not in ("http", "https") or not self.url.hostname:
+            raise ValueError(f"无效的上传地址: {endpoint}")
+        self.path = self.url.path or "/"
+        if self.url.query:
+            self.path += "?" + self.url.query
+        self.token = token
+        self.field = field
+        self.connection = None
+
+    def _connect(self):
+        if self.url.scheme == "https":
+            return http.client.HTTPSConnection(self.url.hostname, self.url.port, timeout=self.TIMEOUT)
+        return http.client.HTTPConnection(self.url.hostname, self.url.port, timeout=self.TIMEOUT)
+
+    def upload(self, path):
+        """上传文件，返回服务器给出的地址（或响应内容）"""
+        with open(path, "rb") as f:
+            data = f.read()
+
+        boundary = uuid.uuid4().hex
+        filename = os.path.basename(path)
+        body = (f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="{self.field}"; filename="{filename}"\r\n'
+                f"Content-Type: {mimetypes.guess_type(filename)[0] or 'application/octet-stream'}\r\n\r\n"
+                ).encode("utf-8") + data + f"\r\n--{boundary}--\r\n".encode("utf-8")
+        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+
+        while True:
+            reused = self.connection is not None
+            if self.connection is None:
+                self.connection = self._connect()
+            try:
+                self.connection.request("POST", self.path, body, headers)
+                response = self.connection.getresponse()
+                content = response.read()  # 必须读完才能复用连接
+            except (OSError, http.client.HTTPException) as e:
+                self.close()
+                if reused:
+                    # 空闲的长连接可能已被服务器关闭，换新连接再试一次
+                    continue
+                raise ShareError(f"网络错误: {e}")
+            if response.will_close:
+                self.close()
+            break
+
+        if 200 <= response.status < 300:
+            return self._parse_location(content)
+        retryable = response.status >= 500 or response.status in (408, 429)
+        raise ShareError(f"HTTP {response.status} {response.reason}", retryable)
+
+    @staticmethod
+    def _parse_location(content):
+        """从响应中取出图片地址：JSON 的 url 字段，否则为响应文本"""
+        text = content.decode("utf-8", "replace").strip()
+        try:
+            result = json.loads(text)
+        except ValueError:
+            return text[:500]
+        if isinstance(result, dict) and result.get("url"):
+            return str(result["url"])
+        return text[:500]
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class ShareQueue(QObject):
+    """截图上传队列
+
+    每个任务保存为 jobs 目录下的一个 JSON 文件，成功后删除，程序重启后继续上传；
+    固定数量的后台线程并发上传，失败后按指数退避重试，界面线程从不等待网络。
+    """
+    uploaded = pyqtSignal(str, str)  # 文件路径, 地址
+    failed = pyqtSignal(str, str)    # 文件路径, 错误信息
+
+    MAX_ATTEMPTS = 6
+    MAX_BACKOFF = 300  # 秒
+
+    def __init__(self, directory, sink_factory=None, concurrency=2):
+        super().__init__()
+        self.jobs_dir = os.path.join(directory, "jobs")
+        self.files_dir = os.path.join(directory, "files")
+        self.failed_dir = os.path.join(directory, "failed")
+        for path in (self.jobs_dir, self.files_dir, self.failed_dir):
+            os.makedirs(path, exist_ok=True)
+
+        self.sink_factory = sink_factory  # 返回上传器；为 None 表示未配置
+        self.generation = 0
+        self.heap = []  # (下次尝试时间, 序号, 任务)
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.stopping = False
+
+        # 恢复上次未完成的任务
+        for name in sorted(os.listdir(self.jobs_dir)):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.jobs_dir, name), encoding="utf-8") as f:
+                        self._schedule(json.load(f))
+                except (OSError, ValueError) as e:
+                    print(f"无法读取上传任务 {name}: {e}")
+
+        self.threads = []
+        for i in range(concurrency):
+            thread = threading.Thread(target=self._run, name=f"share-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def set_sink_factory(self, sink_factory):
+        """修改上传配置，各线程在下一个任务前重建上传器；等待中的任务立即按新配置重试"""
+        with self.condition:
+            self.sink_factory = sink_factory
+            self.generation += 1
+            now = time.time()
+            self.heap = [(min(next_try, now), sequence, job) for next_try, sequence, job in self.heap]
+            heapq.heapify(self.heap)
+            self.condition.notify_all()
+
+    def enqueue(self, path, owned=False):
+        """加入上传队列；owned 为 True 时文件属于队列，上传成功后删除"""
+        job = {"id": uuid.uuid4().hex, "path": path, "owned": owned,
+               "attempts": 0, "next_try": time.time()}
+        try:
+            self._save_job(job)
+        except OSError as e:
+            # 任务文件写不进去时仍在本次运行中上传，只是重启后不会继续
+            print(f"无法保存上传任务: {e}")
+        self._schedule(job)
+
+    def stage_image(self, image):
+        """把图片（例如剪贴板内容）保存到队列目录，返回文件路径"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.files_dir, f"clipboard_{timestamp}_{uuid.uuid4().hex[:6]}.png")
+        if not image.save(path, "PNG"):
+            raise RuntimeError(f"无法写入: {path}")
+        return path
+
+    def pending_count(self):
+        with self.condition:
+            return len(self.heap)
+
+    def stop(self):
+        """停止上传线程（未完成的任务留在磁盘上，下次启动继续）"""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+
+    def _job_path(self, job):
+        return os.path.join(self.jobs_dir, job["id"] + ".json")
+
+    def _save_job(self, job):
+        """原子写入任务文件"""
+        path = self._job_path(job)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def _schedule(self, job):
+        with self.condition:
+            heapq.heappush(self.heap, (job["next_try"], next(self.sequence), job))
+            self.condition.notify()
+
+    def _next_job(self):
+        """取出到期的任务；队列停止时返回 None"""
+        with self.condition:
+            while not self.stopping:
+                now = time.time()
+                if self.heap and self.heap[0][0] <= now:
+                    job = heapq.heappop(self.heap)[2]
+                    return job, self.sink_factory, self.generation
+                self.condition.wait(self.heap[0][0] - now if self.heap else None)
+            return None
+
+    def _run(self):
+        sink = None
+        generation = None
+        try:
+            while True:
+                item = self._next_job()
+                if item is None:
+                    return
+                job, sink_factory, current_generation = item
+
+                if generation != current_generation:
+                    if sink is not None:
+                        sink.close()
+                        sink = None
+                    generation = current_generation
+                    if sink_factory:
+                        try:
+                            sink = sink_factory()
+                        except Exception as e:
+                            # 配置有误（例如上传地址无效）：等重新配置后再试
+                            print(f"无法创建上传器: {e}")
+
+                if sink is None:
+                    # 还没有（正确）配置上传地址，稍后再看
+                    job["next_try"] = time.time() + 60
+                    self._schedule(job)
+                    continue
+                try:
+                    self._upload(sink, job)
+                except Exception as e:
+                    # 意外错误不能让上传线程退出，任务放回队列稍后重试
+                    print(f"上传任务出错: {e}")
+                    job["next_try"] = time.time() + self.MAX_BACKOFF
+                    self._schedule(job)
+        finally:
+            if sink is not None:
+                sink.close()
+
+    def _upload(self, sink, job):
+        path = job["path"]
+        try:
+            location = sink.upload(path)
+        except FileNotFoundError:
+            self._finish_job(job)
+            self.failed.emit(path, "文件不存在")
+        except Exception as e:
+            retryable = e.retryable if isinstance(e, ShareError) else True
+            job["attempts"] += 1
+            if not retryable or job["attempts"] >= self.MAX_ATTEMPTS:
+                # 放弃：任务移到 failed 目录，便于排查
+                try:
+                    os.replace(self._job_path(job), os.path.join(self.failed_dir, job["id"] + ".json"))
+                except OSError as move_error:
+                    # 任务文件留在 jobs 目录，下次启动再试
+                    print(f"无法移动上传任务: {move_error}")
+                self.failed.emit(path, str(e))
+            else:
+                backoff = min(self.MAX_BACKOFF, 2 ** job["attempts"]) + random.random()
+                job["next_try"] = time.time() + backoff
+                self._schedule(job)
+                print(f"上传失败，{backoff:.0f} 秒后重试（第 {job['attempts']} 次）: {e}")
+                try:
+                    self._save_job(job)
+                except OSError as save_error:
+                    print(f"无法保存上传任务: {save_error}")
+        else:
+            self._finish_job(job)
+            self.uploaded.emit(path, location)
+
+    def _finish_job(self, job):
+        """删除任务文件（以及属于队列的暂存文件）"""
+        try:
+            os.remove(self._job_path(job))
+            if job.get("owned") and os.path.exists(job["path"]):
+                os.remove(job["path"])
+        except OSError as e:
+            # 已经上传成功，只是清理失败；任务文件留下时重启后会再上传一次
+            print(f"无法删除上传任务文件: {e}")
+
+
+class CaptureSpool(QObject):
+    """截图暂存区：截图后立即把原始像素写到磁盘，保存时的编码放到空闲时进行
+
+    每个条目是一个与工程文件格式相同的文件（像素不压缩，通过内存映射写入）：
+    - capture_*.sitm：刚截取的画面，程序崩溃或误点取消后可以恢复；
+      总大小超过 MAX_BYTES 时删除最旧的
+    - pending_*.sitm：已点保存、还没编码成 PNG 的画面（含标注），
+      编码完成后删除；启动时继续编码上次没完成的。
+      同一个 PNG 有多个条目时（如打开工程文件后连续保存两次）只写入最新的
+    条目被映射时（Windows 上正在编辑）删不掉，先留下 .consumed 标记，视为已删除，启动时再删。
+    """
+    encoded = pyqtSignal(str)       # 编码完成的截图路径
+    failed = pyqtSignal(str, str)   # 截图路径, 错误信息
+
+    MAX_BYTES = 512 * 1024 * 1024
+    CONSUMED = ".consumed"
+
+    def __init__(self, directory, parent=None):
+        super().__init__(parent)
+        self.directory = directory
+        self.workers = set()
+        self.lock = threading.Lock()
+        self.latest = {}        # PNG 路径 -> 最新的 pending 条目，较旧的条目不再写入
+        self.target_locks = {}  # PNG 路径 -> 锁，同一个 PNG 同时只有一个条目在编码
+        os.makedirs(directory, exist_ok=True)
+
+    def _entries(self, prefix):
+        """某类条目的路径（不含已标记删除的），按时间从旧到新排列"""
+        names = set(os.listdir(self.directory))
+        return [os.path.join(self.directory, name) for name in sorted(names)
+                if name.startswith(prefix) and name.endswith(".sitm")
+                and name + self.CONSUMED not in names]
+
+    def _new_path(self, prefix):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        return os.path.join(self.directory, f"{prefix}_{timestamp}.sitm")
+
+    @classmethod
+    def discard(cls, path):
+        """删除条目；文件仍被映射（Windows 上正在编辑）时留下标记，下次启动再删"""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            try:
+                open(path + cls.CONSUMED, "wb").close()
+            except OSError:
+                pass
+            return
+        try:
+            os.remove(path + cls.CONSUMED)
+        except OSError:
+            pass
+
+    def add(self, pixmap):
+        """截图后立即写入暂存区，返回条目路径（写入失败返回 None，不影响截图）"""
+        if pixmap.isNull():
+            return None
+        path = self._new_path("capture")
+        try:
+            write_frame_file(path, pixmap.toImage(), {"version": 1, "image": "", "ops": []})
+        except OSError as e:
+            print(f"截图暂存失败: {e}")
+            return None
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """暂存区超过大小上限时，从最旧的截图开始删除（未编码的保存不删）"""
+        captures = [path for path in self._entries("capture") if path != keep]
+        total = sum(os.path.getsize(path) for path in self._entries(""))
+        for path in captures:
+            if total <= self.MAX_BYTES:
+                break
+            size = os.path.getsize(path)
+            self.discard(path)
+            if not os.path.exists(path):
+                total -= size
+
+    def latest_capture(self):
+        """最近一次截取、没有保存的画面（没有则返回 None）"""
+        captures = self._entries("capture")
+        return captures[-1] if captures else None
+
+    def commit(self, image, target, capture=None):
+        """保存截图：把画面写入暂存区后立即返回，在空闲优先级的后台线程编码为 PNG
+
+        capture 为这张截图原来的暂存条目，已经不再需要，一并删除。
+        编码完成后发出 encoded 信号。写入暂存区失败时抛出 OSError。
+        """
+        path = self._new_path("pending")
+        write_frame_file(path, image, {"version": 1, "image": os.path.basename(target),
+                                       "ops": [], "target": target})
+        self._supersede(target, path)
+        if capture:
+            self.discard(capture)
+        self.encode_later(path)
+
+    def _supersede(self, target, path):
+        """path 成为 target 最新的条目，还没编码的旧条目不再需要
+
+        旧条目正在编码时删不掉也没关系：编码时会发现自己已被取代，不写入 PNG。
+        """
+        with self.lock:
+            older = self.latest.get(target)
+            self.latest[target] = path
+        if older:
+            self.discard(older)
+
+    def recover(self):
+        """启动时继续编码上次没完成的保存，返回条目数"""
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                # 写到一半的条目
+                self.discard(path)
+            elif name.endswith(self.CONSUMED):
+                # 上次删除时文件正被映射，现在重试
+                self.discard(path[:-len(self.CONSUMED)])
+
+        pending = []
+        for path in self._entries("pending"):
+            try:
+                target = read_frame_meta(path)["target"]
+            except (OSError, ValueError, KeyError):
+                # 无法读取的条目交给 encode 报告错误
+                pending.append(path)
+                continue
+            with self.lock:
+                older = self.latest.get(target)
+            if older in pending:
+                pending.remove(older)
+            self._supersede(target, path)
+            pending.append(path)
+        for path in pending:
+            self.encode_later(path)
+        self.evict()
+        return len(pending)
+
+    def encode_later(self, path):
+        worker = Worker(self.encode, path, priority=QThread.IdlePriority)
+        self.workers.add(worker)
+        worker.signals.finished.connect(self._on_encoded)
+        worker.signals.error.connect(lambda message: self._on_failed(worker, path, message))
+        worker.signals.finished.connect(lambda _: self.workers.discard(worker))
+        QThreadPool.globalInstance().start(worker)
+
+    def _target_lock(self, target):
+        with self.lock:
+            return self.target_locks.setdefault(target, threading.Lock())
+
+    def encode(self, path):
+        """在后台线程中把暂存的画面编码为 PNG，成功后删除条目
+
+        返回 PNG 路径；条目已被同一个 PNG 更新的保存取代时不写入，返回 None。
+        """
+        try:
+            image, meta, mapping = open_frame_file(path)
+        except FileNotFoundError:
+            return None  # 编码前就被更新的保存取代并删除了
+        target = meta["target"]
+        # 临时文件名带上条目名，同一个 PNG 的两个条目不会写到同一个临时文件
+        temp_path = f"{target}.{os.path.splitext(os.path.basename(path))[0]}.tmp"
+        try:
+            with self._target_lock(target):
+                with self.lock:
+                    superseded = self.latest.get(target, path) != path
+                if not superseded:
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    if not image.save(temp_path, "PNG"):
+                        raise RuntimeError(f"无法写入: {target}")
+                    os.replace(temp_path, target)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            # QImage 引用着映射的内存，先释放才能关闭映射、删除文件
+            del image
+            mapping.close()
+        # latest 中的记录保留：被取代但还没删掉的旧条目之后编码时仍要跳过
+        self.discard(path)
+        return None if superseded else target
+
+    def _on_encoded(self, target):
+        if target is not None:
+            self.encoded.emit(target)
+
+    def _on_failed(self, worker, path, message):
+        """编码失败：条目留在暂存区，下次启动再试"""
+        self.workers.discard(worker)
+        self.failed.emit(path, message)
+
+
 class FloatingWindow(QWidget):
     """悬浮窗界面"""
 
@@ -713,6 +3491,11 @@ class FloatingWindow(QWidget):
         btn_region.clicked.connect(self.region_screenshot)
         layout.addWidget(btn_region)
 
+        # 区域录屏按钮
+        btn_record = QPushButton("🎬 区域录屏")
+        btn_record.clicked.connect(self.region_recording)
+        layout.addWidget(btn_record)
+
         # 提示标签
         hint = QLabel("支持触屏画笔标注")
         hint.setAlignment(Qt.AlignCenter)
@@ -751,7 +3534,9 @@ class FloatingWindow(QWidget):
         """执行全屏截图"""
         screen = QApplication.primaryScreen()
         pixmap = screen.grabWindow(0)
-        self.parent_app.show_editor(pixmap)
+        # 立即写入暂存区，程序崩溃或误点取消后可以恢复
+        spool_entry = self.parent_app.spool.add(pixmap)
+        self.parent_app.show_editor(pixmap, spool_entry=spool_entry)
 
     def region_screenshot(self):
         """区域截图"""
@@ -763,7 +3548,20 @@ class FloatingWindow(QWidget):
         """执行区域截图"""
         screen = QApplication.primaryScreen()
         screen_pixmap = screen.grabWindow(0)
-        self.parent_app.show_region_selector(screen_pixmap)
+        spool_entry = self.parent_app.spool.add(screen_pixmap)
+        self.parent_app.show_region_selector(screen_pixmap, spool_entry=spool_entry)
+
+    def region_recording(self):
+        """区域录屏"""
+        self.hide()
+        # 使用定时器延迟截图，确保窗口完全隐藏
+        QTimer.singleShot(100, self._do_region_recording)
+
+    def _do_region_recording(self):
+        """截取当前屏幕用于选择录屏区域"""
+        screen = QApplication.primaryScreen()
+        screen_pixmap = screen.grabWindow(0)
+        self.parent_app.show_region_selector(screen_pixmap, record=True)
 
     def mousePressEvent(self, event):
         """鼠标/触摸按下 - 用于拖动窗口"""
@@ -790,8 +3588,34 @@ class ScreenshotApp(QApplication):
         self.floating_window = None
         self.editor_window = None
         self.region_selector = None
+        self.recorder = None
+        self.recording_panel = None
+        self.record_format = "gif"  # "gif" 或 "apng"
+        self.settings = QSettings("windy003", "ScreenshotTool")
+        self.workers = set()  # 正在运行的后台任务（保持引用直到完成）
+        self.input_record_dir = None  # 不为空时录制输入事件到该目录
+        self.selector_spool_entry = None  # 区域截图时整个屏幕在暂存区中的条目
+
+        # 截图暂存区：保存时先写入，空闲时编码，编码完成后再做压缩、上传
+        self.spool = CaptureSpool(os.path.join(get_data_dir(), "spool"), self)
+        self.spool.encoded.connect(self.on_screenshot_saved)
+        self.spool.failed.connect(self.on_spool_failed)
+
+        # 上传队列（上传地址在托盘菜单中设置）
+        self.share_queue = ShareQueue(os.path.join(get_data_dir(), "share_queue"))
+        self.share_queue.uploaded.connect(self.on_share_uploaded)
+        self.share_queue.failed.connect(self.on_share_failed)
+        self.update_share_sink()
+
         self.init_tray()
 
+        # 继续编码上次没完成的保存
+        recovered = self.spool.recover()
+        if recovered:
+            print(f"正在保存上次未完成的 {recovered} 张截图")
+            self.tray_icon.showMessage("截图工具", f"正在保存上次未完成的 {recovered} 张截图",
+                                       QSystemTrayIcon.Information, 2000)
+
     def init_tray(self):
         """初始化系统托盘"""
         # 创建托盘图标
@@ -807,6 +3631,47 @@ class ScreenshotApp(QApplication):
         show_action = tray_menu.addAction("显示截图工具")
         show_action.triggered.connect(self.show_floating_window)
 
+        # 录屏格式
+        format_menu = tray_menu.addMenu("录屏格式")
+        format_group = QActionGroup(format_menu)
+        for fmt, text in (("gif", "GIF"), ("apng", "APNG（动画 PNG）")):
+            action = format_menu.addAction(text)
+            action.setCheckable(True)
+            action.setChecked(fmt == self.record_format)
+            action.triggered.connect(lambda checked, fmt=fmt: self.set_record_format(fmt))
+            format_group.addAction(action)
+
+        # 保存后压缩
+        optimize_action = tray_menu.addAction("保存后压缩 PNG（视觉无损）")
+        optimize_action.setCheckable(True)
+        optimize_action.setChecked(self.settings.value("optimize_png", False, type=bool))
+        optimize_action.toggled.connect(lambda checked: self.settings.setValue("optimize_png", checked))
+
+        # 工程文件
+        project_action = tray_menu.addAction("保存时同时保存工程文件（可再编辑）")
+        project_action.setCheckable(True)
+        project_action.setChecked(self.settings.value("project/save", False, type=bool))
+        project_action.toggled.connect(lambda checked: self.settings.setValue("project/save", checked))
+        open_project_action = tray_menu.addAction("打开工程文件…")
+        open_project_action.triggered.connect(self.choose_project_to_open)
+
+        recover_action = tray_menu.addAction("恢复上次截图")
+        recover_action.triggered.connect(self.recover_capture)
+
+        # 上传
+        share_menu = tray_menu.addMenu("上传")
+        auto_share_action = share_menu.addAction("保存/复制后自动上传")
+        auto_share_action.setCheckable(True)
+        auto_share_action.setChecked(self.settings.value("share/auto", False, type=bool))
+        auto_share_action.toggled.connect(lambda checked: self.settings.setValue("share/auto", checked))
+        share_clipboard_action = share_menu.addAction("上传剪贴板图片")
+        share_clipboard_action.triggered.connect(self.share_clipboard_image)
+        share_settings_action = share_menu.addAction("设置上传地址…")
+        share_settings_action.triggered.connect(self.configure_share)
+
+        compare_action = tray_menu.addAction("对比两张截图…")
+        compare_action.triggered.connect(self.choose_screenshots_to_compare)
+
         tray_menu.addSeparator()
 
         quit_action = tray_menu.addAction("退出")
@@ -866,19 +3731,36 @@ class ScreenshotApp(QApplication):
         self.floating_window.raise_()
         self.floating_window.activateWindow()
 
-    def show_editor(self, pixmap):
-        """显示编辑窗口"""
+    def show_editor(self, pixmap, highlights=None, project_path=None, spool_entry=None):
+        """显示编辑窗口（project_path 不为空时打开工程文件，忽略 pixmap）"""
         if self.editor_window:
             self.editor_window.close()
 
-        self.editor_window = ScreenshotEditor(pixmap)
+        if project_path:
+            self.editor_window = ScreenshotEditor.from_project(project_path)
+        else:
+            self.editor_window = ScreenshotEditor(pixmap, highlights)
+        self.editor_window.save_project = self.settings.value("project/save", False, type=bool)
+        self.editor_window.spool = self.spool
+        self.editor_window.spool_entry = spool_entry
         self.editor_window.closed.connect(self.on_editor_closed)
+        self.editor_window.saved.connect(self.on_screenshot_saved)
+        self.editor_window.copied.connect(self.on_screenshot_copied)
+        if self.input_record_dir:
+            InputRecorder(self.editor_window, self.input_record_dir)
         self.editor_window.show()
 
-    def show_region_selector(self, screen_pixmap):
-        """显示区域选择器"""
-        self.region_selector = RegionSelector(screen_pixmap)
-        self.region_selector.region_selected.connect(self.on_region_selected)
+    def show_region_selector(self, screen_pixmap, record=False, spool_entry=None):
+        """显示区域选择器（record 为 True 时选择录屏区域）"""
+        self.selector_spool_entry = spool_entry
+        if record:
+            self.region_selector = RegionSelector(screen_pixmap, "拖动选择录屏区域 | 按住此框可移动")
+            self.region_selector.region_selected.connect(self.on_record_region_selected)
+        else:
+            self.region_selector = RegionSelector(screen_pixmap)
+            self.region_selector.region_selected.connect(self.on_region_selected)
+        if self.input_record_dir:
+            InputRecorder(self.region_selector, self.input_record_dir)
         self.region_selector.show()
 
     def on_region_selected(self, rect):
@@ -887,8 +3769,240 @@ class ScreenshotApp(QApplication):
         screen = QApplication.primaryScreen()
         pixmap = screen.grabWindow(0, rect.x(), rect.y(), rect.width(), rect.height())
 
+        # 选中的区域写入暂存区后，整个屏幕的画面就不需要了
+        spool_entry = self.spool.add(pixmap)
+        if spool_entry and self.selector_spool_entry:
+            self.spool.discard(self.selector_spool_entry)
+        self.selector_spool_entry = None
+
         # 显示编辑窗口
-        self.show_editor(pixmap)
+        self.show_editor(pixmap, spool_entry=spool_entry)
+
+    def set_record_format(self, fmt):
+        """设置录屏格式"""
+        self.record_format = fmt
+
+    def on_record_region_selected(self, rect):
+        """录屏区域选择完成，等选择窗口消失后开始录制"""
+        QTimer.singleShot(100, lambda: self.start_recording(rect))
+
+    def start_recording(self, rect):
+        """开始区域录屏"""
+        self.recorder = RegionRecorder(rect, self.record_format)
+        self.recorder.finished.connect(self.on_recording_finished)
+        self.recorder.failed.connect(self.on_recording_failed)
+        self.recording_panel = RecordingPanel(self.recorder)
+        self.recording_panel.show()
+        self.recorder.start()
+
+    def on_recording_finished(self, path):
+        """录屏编码完成"""
+        stats = self.recorder.stats
+        print(f"录屏已保存到: {path}（写入 {stats.written} 帧，丢帧 {stats.dropped}）")
+        self.tray_icon.showMessage("截图工具", f"录屏已保存到:\n{path}",
+                                   QSystemTrayIcon.Information, 3000)
+        self.end_recording()
+
+    def on_recording_failed(self, message):
+        """录屏编码失败"""
+        print(f"录屏失败: {message}")
+        self.tray_icon.showMessage("截图工具", f"录屏失败: {message}",
+                                   QSystemTrayIcon.Warning, 3000)
+        self.end_recording()
+
+    def end_recording(self):
+        """关闭录屏面板，重新显示悬浮窗"""
+        if self.recording_panel:
+            self.recording_panel.close()
+            self.recording_panel = None
+        if self.recorder:
+            # 信号在编码线程退出前发出，确保线程结束后再释放
+            self.recorder.encoder.wait()
+            self.recorder = None
+        if self.floating_window:
+            self.floating_window.show()
+
+    def run_in_background(self, worker, on_finished, on_error=None):
+        """在线程池中运行后台任务"""
+        self.workers.add(worker)
+        worker.signals.finished.connect(on_finished)
+        worker.signals.error.connect(on_error or self.on_background_error)
+        worker.signals.finished.connect(lambda _: self.workers.discard(worker))
+        worker.signals.error.connect(lambda _: self.workers.discard(worker))
+        QThreadPool.globalInstance().start(worker)
+
+    def on_background_error(self, message):
+        """后台任务出错"""
+        print(f"后台任务出错: {message}")
+
+    def on_screenshot_saved(self, filepath):
+        """截图保存后的后续处理：压缩（可选）之后再上传（可选）"""
+        if self.settings.value("optimize_png", False, type=bool):
+            # 空闲优先级，不和界面操作抢 CPU
+            worker = Worker(optimize_png, filepath, priority=QThread.IdlePriority)
+            self.run_in_background(worker, self.on_png_optimized,
+                                   lambda message: self.on_png_optimize_failed(filepath, message))
+        else:
+            self.auto_share(filepath)
+
+    def on_png_optimized(self, result):
+        """PNG 压缩完成，报告节省的空间"""
+        path, original_size, new_size = result
+        if new_size >= original_size:
+            print(f"无需压缩: {path}")
+        else:
+            saved = original_size - new_size
+            message = (f"{os.path.basename(path)}: {format_size(original_size)} → {format_size(new_size)}，"
+                       f"节省 {format_size(saved)}（{saved * 100 // original_size}%）")
+            print(f"已压缩 {message}")
+            self.tray_icon.showMessage("截图工具", f"已压缩 {message}", QSystemTrayIcon.Information, 2000)
+        self.auto_share(path)
+
+    def on_png_optimize_failed(self, filepath, message):
+        """PNG 压缩失败，原文件不变，照常上传"""
+        print(f"压缩失败: {message}")
+        self.auto_share(filepath)
+
+    def update_share_sink(self):
+        """根据设置更新上传器"""
+        endpoint = self.settings.value("share/endpoint", "", type=str)
+        token = self.settings.value("share/token", "", type=str)
+        if endpoint:
+            self.share_queue.set_sink_factory(lambda: HttpShareSink(endpoint, token))
+        else:
+            self.share_queue.set_sink_factory(None)
+
+    def configure_share(self):
+        """设置上传地址和访问令牌"""
+        endpoint, ok = QInputDialog.getText(None, "上传地址", "HTTP 上传地址（留空则关闭上传）:",
+                                            text=self.settings.value("share/endpoint", "", type=str))
+        if not ok:
+            return
+        endpoint = endpoint.strip()
+        if endpoint:
+            try:
+                HttpShareSink(endpoint)
+            except ValueError as e:
+                self.tray_icon.showMessage("截图工具", str(e), QSystemTrayIcon.Warning, 3000)
+                return
+            token, ok = QInputDialog.getText(None, "访问令牌", "访问令牌（可选，作为 Bearer 令牌发送）:",
+                                             text=self.settings.value("share/token", "", type=str))
+            if ok:
+                self.settings.setValue("share/token", token.strip())
+        self.settings.setValue("share/endpoint", endpoint)
+        self.update_share_sink()
+
+    def share_enabled(self):
+        """是否已配置上传地址"""
+        return bool(self.settings.value("share/endpoint", "", type=str))
+
+    def auto_share(self, filepath):
+        """开启自动上传时把文件加入上传队列"""
+        if self.share_enabled() and self.settings.value("share/auto", False, type=bool):
+            self.share_queue.enqueue(filepath)
+
+    def on_screenshot_copied(self, image):
+        """截图复制到剪贴板后，开启自动上传时也上传"""
+        if self.share_enabled() and self.settings.value("share/auto", False, type=bool):
+            self.share_image(image)
+
+    def share_clipboard_image(self):
+        """上传剪贴板中的图片"""
+        if not self.share_enabled():
+            self.tray_icon.showMessage("截图工具", "请先设置上传地址", QSystemTrayIcon.Warning, 2000)
+            return
+        image = QApplication.clipboard().image()
+        if image.isNull():
+            self.tray_icon.showMessage("截图工具", "剪贴板中没有图片", QSystemTrayIcon.Warning, 2000)
+            return
+        self.share_image(image)
+
+    def share_image(self, image):
+        """在后台把图片编码保存到上传队列目录，再加入队列"""
+        worker = Worker(self.share_queue.stage_image, image)
+        self.run_in_background(worker, lambda path: self.share_queue.enqueue(path, owned=True))
+
+    def on_share_uploaded(self, path, location):
+        """上传成功"""
+        print(f"已上传 {path}: {location}")
+        self.tray_icon.showMessage("截图工具", f"已上传:\n{location}", QSystemTrayIcon.Information, 3000)
+
+    def on_share_failed(self, path, message):
+        """上传最终失败（已放弃重试）"""
+        print(f"上传失败 {path}: {message}")
+        self.tray_icon.showMessage("截图工具", f"上传失败: {message}", QSystemTrayIcon.Warning, 3000)
+
+    def choose_screenshots_to_compare(self):
+        """选择两张截图进行对比（修改时间较晚的作为新截图）"""
+        paths, _ = QFileDialog.getOpenFileNames(None, "选择两张要对比的截图", get_screenshots_dir(),
+                                                "图片 (*.png *.jpg *.jpeg *.bmp)")
+        if not paths:
+            return
+        if len(paths) != 2:
+            self.tray_icon.showMessage("截图工具", "请选择两张截图", QSystemTrayIcon.Warning, 2000)
+            return
+        before_path, after_path = sorted(paths, key=os.path.getmtime)
+        self.compare_screenshots(before_path, after_path)
+
+    def compare_screenshots(self, before_path, after_path):
+        """在后台对比两张截图，完成后在编辑窗口中显示新截图并框出变化区域"""
+        worker = Worker(compare_screenshots, before_path, after_path)
+        self.run_in_background(worker, self.on_compare_finished, self.on_compare_failed)
+
+    def on_compare_finished(self, result):
+        """对比完成"""
+        after_path, regions, elapsed_ms = result
+        print(f"对比完成: {len(regions)} 处差异，用时 {elapsed_ms:.0f} ms")
+        if self.floating_window:
+            self.floating_window.hide()
+        self.show_editor(QPixmap(after_path), regions)
+
+    def on_compare_failed(self, message):
+        """对比失败"""
+        print(f"对比失败: {message}")
+        self.tray_icon.showMessage("截图工具", f"对比失败: {message}", QSystemTrayIcon.Warning, 3000)
+
+    def choose_project_to_open(self):
+        """选择一个工程文件继续编辑"""
+        path, _ = QFileDialog.getOpenFileName(None, "打开工程文件", get_screenshots_dir(),
+                                              "截图工程文件 (*.sitm)")
+        if path:
+            self.open_project(path)
+
+    def open_project(self, path):
+        """打开工程文件：显示原始截图和标注，可以撤销或继续标注后重新保存"""
+        if self.floating_window:
+            self.floating_window.hide()
+        try:
+            self.show_editor(None, project_path=path)
+        except (OSError, ValueError) as e:
+            self.editor_window = None
+            self.on_editor_closed()
+            self.tray_icon.showMessage("截图工具", f"无法打开工程文件: {e}",
+                                       QSystemTrayIcon.Warning, 3000)
+
+    def recover_capture(self):
+        """在编辑窗口中打开最近一次截取但没有保存的画面"""
+        path = self.spool.latest_capture()
+        if path is None:
+            self.tray_icon.showMessage("截图工具", "没有可恢复的截图", QSystemTrayIcon.Information, 2000)
+            return
+        try:
+            image, _, mapping = open_frame_file(path)
+        except (OSError, ValueError) as e:
+            self.spool.discard(path)
+            self.tray_icon.showMessage("截图工具", f"无法恢复截图: {e}", QSystemTrayIcon.Warning, 3000)
+            return
+        if self.floating_window:
+            self.floating_window.hide()
+        self.show_editor(image, spool_entry=path)
+        self.editor_window.base_mapping = mapping
+
+    def on_spool_failed(self, path, message):
+        """暂存的截图编码失败，条目留在暂存区，下次启动再试"""
+        print(f"截图保存失败: {message}（暂存于 {path}）")
+        self.tray_icon.showMessage("截图工具", f"截图保存失败: {message}",
+                                   QSystemTrayIcon.Warning, 3000)
 
     def on_editor_closed(self):
         """编辑窗口关闭后，重新显示悬浮窗"""
@@ -897,12 +4011,70 @@ class ScreenshotApp(QApplication):
 
     def quit_app(self):
         """退出程序"""
+        # 未完成的上传留在磁盘上，下次启动继续
+        self.share_queue.stop()
+        if self.recorder:
+            # 停止录屏并等待已录制的帧编码完成
+            self.recorder.stop()
+            self.recorder.encoder.wait()
         self.tray_icon.hide()
         self.quit()
 
 
 def main():
-    app = ScreenshotApp(sys.argv)
+    parser = argparse.ArgumentParser(description="触屏截图工具")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="对比两张截图，在编辑窗口中框出新截图的变化区域")
+    parser.add_argument("--record-input", metavar="DIR",
+                        help="把编辑窗口和区域选择窗口的输入事件录制到该目录")
+    parser.add_argument("--open", metavar="FILE",
+                        help="打开工程文件（.sitm）继续编辑")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="在无界面（offscreen）模式下回放录制的输入事件并输出耗时统计")
+    parser.add_argument("--replay-speed", choices=("original", "max"), default="max",
+                        help="回放速度：original 按录制时的间隔，max 尽快回放（默认）")
+    parser.add_argument("--batch", nargs="?", const="", metavar="DIR",
+                        help="批量处理目录中的截图（不指定目录时处理截图保存目录），处理完退出")
+    parser.add_argument("--op", action="append", default=[], metavar="OP",
+                        help="批处理操作，可重复，按顺序执行：resize:50%% | resize:1280x720 | "
+                             "resize:1280x | crop:x,y,w,h | redact:x,y,w,h | stamp:文字（{time} {name}）")
+    parser.add_argument("--output", metavar="DIR",
+                        help="批处理输出目录（默认源目录下的 processed）")
+    parser.add_argument("--format", choices=("keep",) + tuple(BATCH_FORMATS), default="keep",
+                        help="批处理输出格式，keep 表示保持原格式（默认）")
+    parser.add_argument("--quality", type=int, default=-1, metavar="0-100",
+                        help="JPG/WebP 质量或 PNG 压缩程度，默认使用 Qt 的默认值")
+    parser.add_argument("--jobs", type=int, default=None, metavar="N",
+                        help="批处理进程数（默认 CPU 核数）")
+    parser.add_argument("--force", action="store_true",
+                        help="忽略清单，重新处理所有文件")
+    args, qt_args = parser.parse_known_args()
+
+    if args.batch is not None:
+        source_dir = args.batch or get_screenshots_dir()
+        try:
+            ops = [parse_batch_op(spec) for spec in args.op]
+        except ValueError as e:
+            parser.error(str(e))
+        if not ops and args.format == "keep":
+            parser.error("--batch 需要至少一个 --op 或 --format")
+        output = args.output or os.path.join(source_dir, "processed")
+        ok = run_batch(source_dir, output, ops, args.format, args.quality, args.jobs, args.force)
+        sys.exit(0 if ok else 1)
+
+    if args.replay:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        app = QApplication(sys.argv[:1] + qt_args)
+        report = replay_input_recording(args.replay, args.replay_speed)
+        print(format_replay_report(report, args.replay_speed))
+        sys.exit(0)
+
+    app = ScreenshotApp(sys.argv[:1] + qt_args)
+    app.input_record_dir = args.record_input
+    if args.compare:
+        app.compare_screenshots(*args.compare)
+    if args.open:
+        app.open_project(args.open)
     sys.exit(app.exec_())
 
 
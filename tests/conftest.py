@@ -0,0 +1,16 @@
+import os
+import sys
+
+# 测试在无显示器的环境中运行；必须在导入 PyQt5 之前设置
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from PyQt5.QtWidgets import QApplication
+
+
+@pytest.fixture(scope="session", autouse=True)
+def qapp():
+    """整个测试会话共用一个 QApplication（绘制文字、创建窗口都需要）"""
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    yield app
@@ -0,0 +1,44 @@
+import json
+import os
+
+from PyQt5.QtGui import QColor, QImage
+
+from screenshot_tool import BATCH_MANIFEST, parse_batch_op, run_batch
+
+
+def write_image(path, color):
+    image = QImage(40, 30, QImage.Format_RGB32)
+    image.fill(QColor(color))
+    assert image.save(path)
+
+
+def test_same_stem_different_extension_get_separate_outputs(tmp_path):
+    source = tmp_path / "in"
+    output = tmp_path / "out"
+    source.mkdir()
+    write_image(str(source / "a.png"), "red")
+    write_image(str(source / "a.jpg"), "blue")
+    write_image(str(source / "b.png"), "green")
+
+    assert run_batch(str(source), str(output), [], fmt="png", jobs=1)
+    assert sorted(os.listdir(output)) == [BATCH_MANIFEST, "a_jpg.png", "a_png.png", "b.png"]
+    assert QImage(str(output / "a_png.png")).pixelColor(5, 5) == QColor("red")
+    assert QImage(str(output / "a_jpg.png")).pixelColor(5, 5).blue() > 200
+
+
+def test_touched_file_is_redone_when_stamp_uses_time(tmp_path, capsys):
+    source = tmp_path / "in"
+    output = tmp_path / "out"
+    source.mkdir()
+    write_image(str(source / "a.png"), "red")
+
+    for spec, redone in (("stamp:{name}", False), ("stamp:{time}", True)):
+        ops = [parse_batch_op(spec)]
+        assert run_batch(str(source), str(output), ops, jobs=1, force=True)
+        stat = os.stat(source / "a.png")
+        os.utime(source / "a.png", (stat.st_atime, stat.st_mtime + 3600))
+        capsys.readouterr()
+        assert run_batch(str(source), str(output), ops, jobs=1)
+        assert ("待处理 1 张" in capsys.readouterr().out) == redone
+        with open(output / BATCH_MANIFEST, encoding="utf-8") as f:
+            assert json.load(f)["a.png"]["mtime"] == os.stat(source / "a.png").st_mtime
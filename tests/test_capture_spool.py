@@ -0,0 +1,145 @@
+import os
+
+from PyQt5.QtCore import QThreadPool
+from PyQt5.QtGui import QColor, QImage, QPixmap
+from PyQt5.QtWidgets import QApplication
+
+from screenshot_tool import CaptureSpool, write_frame_file
+
+
+def make_image(color):
+    image = QImage(40, 30, QImage.Format_RGB32)
+    image.fill(QColor(color))
+    return image
+
+
+def wait_for_workers():
+    QThreadPool.globalInstance().waitForDone()
+    QApplication.processEvents()
+
+
+def write_pending(spool, target, color):
+    """模拟上次没编码完的保存"""
+    path = spool._new_path("pending")
+    write_frame_file(path, make_image(color), {"version": 1, "image": os.path.basename(target),
+                                               "ops": [], "target": target})
+    return path
+
+
+def fail_remove_for(monkeypatch, locked):
+    """模拟 Windows 上被映射的文件删不掉"""
+    real_remove = os.remove
+
+    def remove(path):
+        if path == locked:
+            raise PermissionError(13, "文件正被映射", path)
+        real_remove(path)
+    monkeypatch.setattr(os, "remove", remove)
+
+
+def test_commit_encodes_png_and_removes_entry(tmp_path):
+    spool = CaptureSpool(str(tmp_path / "spool"))
+    capture = spool.add(QPixmap.fromImage(make_image("white")))
+    assert spool.latest_capture() == capture
+    encoded = []
+    spool.encoded.connect(encoded.append)
+
+    target = str(tmp_path / "shots" / "shot.png")
+    spool.commit(make_image("red"), target, capture)
+    wait_for_workers()
+
+    assert encoded == [target]
+    assert QImage(target).pixelColor(5, 5) == QColor("red")
+    assert os.listdir(tmp_path / "spool") == []
+    assert os.listdir(tmp_path / "shots") == ["shot.png"]
+
+
+def test_newer_commit_for_same_target_wins(tmp_path, monkeypatch):
+    spool = CaptureSpool(str(tmp_path / "spool"))
+    queued = []
+    monkeypatch.setattr(spool, "encode_later", queued.append)
+    target = str(tmp_path / "shot.png")
+
+    spool.commit(make_image("red"), target)
+    # 旧条目正在编码（被映射）时删不掉，之后才轮到它
+    fail_remove_for(monkeypatch, queued[0])
+    spool.commit(make_image("blue"), target)
+    monkeypatch.undo()
+    assert os.path.exists(queued[0])
+
+    assert spool.encode(queued[1]) == target
+    assert spool.encode(queued[0]) is None
+    assert QImage(target).pixelColor(5, 5) == QColor("blue")
+    assert os.listdir(tmp_path / "spool") == []
+
+
+def test_superseded_entry_is_deleted_before_encoding(tmp_path, monkeypatch):
+    spool = CaptureSpool(str(tmp_path / "spool"))
+    queued = []
+    monkeypatch.setattr(spool, "encode_later", queued.append)
+    target = str(tmp_path / "shot.png")
+
+    spool.commit(make_image("red"), target)
+    spool.commit(make_image("blue"), target)
+    assert not os.path.exists(queued[0])
+    assert spool.encode(queued[0]) is None
+    assert spool.encode(queued[1]) == target
+    assert QImage(target).pixelColor(5, 5) == QColor("blue")
+
+
+def test_recover_encodes_leftover_entries(tmp_path):
+    directory = tmp_path / "spool"
+    spool = CaptureSpool(str(directory))
+    first = str(tmp_path / "first.png")
+    second = str(tmp_path / "second.png")
+    write_pending(spool, first, "red")
+    write_pending(spool, second, "green")
+    write_pending(spool, second, "blue")  # 同一个 PNG 只编码最新的
+    (directory / "pending_broken.sitm.tmp").write_bytes(b"half")
+
+    restarted = CaptureSpool(str(directory))
+    encoded = []
+    restarted.encoded.connect(encoded.append)
+    assert restarted.recover() == 2
+    wait_for_workers()
+
+    assert sorted(encoded) == [first, second]
+    assert QImage(first).pixelColor(5, 5) == QColor("red")
+    assert QImage(second).pixelColor(5, 5) == QColor("blue")
+    assert os.listdir(directory) == []
+
+
+def test_undeletable_capture_is_not_offered_again(tmp_path, monkeypatch):
+    directory = tmp_path / "spool"
+    spool = CaptureSpool(str(directory))
+    older = spool.add(QPixmap.fromImage(make_image("white")))
+    recovered = spool.add(QPixmap.fromImage(make_image("gray")))
+
+    # 从“恢复上次截图”打开后保存：条目仍被映射，删不掉
+    fail_remove_for(monkeypatch, recovered)
+    spool.commit(make_image("red"), str(tmp_path / "shot.png"), recovered)
+    monkeypatch.undo()
+    wait_for_workers()
+    assert os.path.exists(recovered)
+    assert spool.latest_capture() == older
+
+    # 下次启动时文件已不再被映射，重试删除
+    CaptureSpool(str(directory)).recover()
+    assert sorted(os.listdir(directory)) == [os.path.basename(older)]
+
+
+def test_evict_keeps_pending_entries(tmp_path, monkeypatch):
+    spool = CaptureSpool(str(tmp_path / "spool"))
+    queued = []
+    monkeypatch.setattr(spool, "encode_later", queued.append)
+    captures = [spool.add(QPixmap.fromImage(make_image("white"))) for _ in range(3)]
+    spool.commit(make_image("red"), str(tmp_path / "a.png"))
+    spool.commit(make_image("blue"), str(tmp_path / "b.png"))
+
+    monkeypatch.setattr(CaptureSpool, "MAX_BYTES", 1)
+    latest = spool.add(QPixmap.fromImage(make_image("gray")))
+    assert all(not os.path.exists(path) for path in captures)
+    assert all(os.path.exists(path) for path in queued)
+    assert os.path.exists(latest)
+    spool.evict()
+    assert all(os.path.exists(path) for path in queued)
@@ -0,0 +1,47 @@
+import numpy as np
+
+from screenshot_tool import diff_regions
+
+
+def screen(width=200, height=150, color=0xFFF0F0F0):
+    return np.full((height, width), color, dtype=np.uint32)
+
+
+def test_identical_screens_have_no_regions():
+    before = screen()
+    assert diff_regions(before, before.copy()) == []
+    assert diff_regions(before, before.copy(), tolerance=10) == []
+
+
+def test_single_changed_pixel():
+    before = screen()
+    after = before.copy()
+    after[70, 45] = 0xFF000000
+    assert diff_regions(before, after) == [(45, 70, 1, 1)]
+
+
+def test_adjacent_tiles_merge_and_distant_changes_stay_apart():
+    before = screen()
+    after = before.copy()
+    after[20:40, 25:70] = 0xFFFF0000   # 跨越多个分块
+    after[140, 190] = 0xFF0000FF
+    assert sorted(diff_regions(before, after)) == [(25, 20, 45, 20), (190, 140, 1, 1)]
+
+
+def test_size_mismatch_reports_extra_area():
+    before = screen(200, 150)
+    after = screen(230, 170)
+    after[10, 10] = 0xFF000000
+    assert sorted(diff_regions(before, after)) == [(0, 150, 200, 20), (10, 10, 1, 1), (200, 0, 30, 170)]
+    # 新截图更小时只比较重叠部分
+    assert diff_regions(after, before) == [(10, 10, 1, 1)]
+
+
+def test_tolerance_ignores_small_channel_differences():
+    before = screen()
+    after = before.copy()
+    after[30:34, 100:140] = 0xFFF3EEF0   # R +3, G -2
+    after[120, 60] = 0xFFF0F0FA          # B +10
+    assert sorted(diff_regions(before, after)) == [(60, 120, 1, 1), (100, 30, 40, 4)]
+    assert diff_regions(before, after, tolerance=3) == [(60, 120, 1, 1)]
+    assert diff_regions(before, after, tolerance=10) == []
@@ -0,0 +1,77 @@
+import hashlib
+import struct
+
+from PyQt5.QtCore import QEvent, QPointF, Qt
+from PyQt5.QtGui import QColor, QKeyEvent, QMouseEvent, QPixmap
+from PyQt5.QtWidgets import QApplication
+
+from screenshot_tool import InputRecorder, ScreenshotEditor, qimage_to_array, replay_input_recording
+
+
+def canvas_hash(editor):
+    """与 replay_input_recording 相同的画布哈希"""
+    canvas = editor.ensure_canvas().toImage()
+    digest = hashlib.sha256()
+    digest.update(struct.pack("<II", canvas.width(), canvas.height()))
+    digest.update(qimage_to_array(canvas).tobytes())
+    return digest.hexdigest()
+
+
+def send_mouse(widget, event_type, x, y, button, buttons):
+    pos = QPointF(x, y)
+    event = QMouseEvent(event_type, pos, QPointF(widget.mapToGlobal(pos.toPoint())),
+                        button, buttons, Qt.NoModifier)
+    QApplication.sendEvent(widget, event)
+    QApplication.processEvents()
+
+
+def draw_stroke(widget, points):
+    send_mouse(widget, QEvent.MouseButtonPress, *points[0], Qt.LeftButton, Qt.LeftButton)
+    for x, y in points[1:]:
+        send_mouse(widget, QEvent.MouseMove, x, y, Qt.NoButton, Qt.LeftButton)
+    send_mouse(widget, QEvent.MouseButtonRelease, *points[-1], Qt.LeftButton, Qt.NoButton)
+
+
+def record_session(tmp_path, actions):
+    """在编辑窗口中执行 actions 并录制，返回 (录制文件, 标注记录, 画布哈希)"""
+    pixmap = QPixmap(400, 300)
+    pixmap.fill(QColor("white"))
+    editor = ScreenshotEditor(pixmap)
+    editor.show()
+    QApplication.processEvents()
+    recorder = InputRecorder(editor, str(tmp_path))
+    actions(editor)
+    ops, digest = [dict(op) for op in editor.ops], canvas_hash(editor)
+    editor.close()
+    return recorder.path, ops, digest
+
+
+def curve(start_x, start_y, count=30):
+    """带小数坐标的弯曲笔画"""
+    return [(start_x + i * 4.37, start_y + (i * 0.61) ** 2 + 0.29) for i in range(count)]
+
+
+def test_replay_reproduces_fractional_mouse_strokes(tmp_path):
+    path, ops, digest = record_session(tmp_path, lambda editor: draw_stroke(editor, curve(110.4, 128.69)))
+    assert any(x != int(x) for x, y, *_ in ops[0]["points"])
+
+    report = replay_input_recording(path)
+    assert report["ops"] == ops
+    assert report["hash"] == digest
+
+
+def test_replay_reproduces_undo(tmp_path):
+    def actions(editor):
+        draw_stroke(editor, curve(110.4, 128.69))
+        editor.undo_btn.click()
+        draw_stroke(editor, curve(150.2, 60.5))
+        draw_stroke(editor, curve(60.7, 90.1))
+        QApplication.sendEvent(editor, QKeyEvent(QEvent.KeyPress, Qt.Key_Z, Qt.ControlModifier))
+        draw_stroke(editor, curve(200.3, 40.9, count=12))
+
+    path, ops, digest = record_session(tmp_path, actions)
+    assert len(ops) == 2
+
+    report = replay_input_recording(path)
+    assert report["ops"] == ops
+    assert report["hash"] == digest
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+from PyQt5.QtGui import QColor, QFont, QImage, QPainter, QPen
+
+from screenshot_tool import PNG_MAX_ERROR, optimize_png, qimage_to_array
+
+
+def channel_error(a, b):
+    return max(int(np.abs(((a >> shift) & 0xFF).astype(int) - ((b >> shift) & 0xFF).astype(int)).max())
+               for shift in (16, 8, 0))
+
+
+def ui_image():
+    """类似界面截图：标题栏、侧边栏、抗锯齿文字和圆形，几百种颜色"""
+    image = QImage(1200, 800, QImage.Format_RGB32)
+    image.fill(QColor("#f3f3f3"))
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.Antialiasing)
+    painter.fillRect(0, 0, 1200, 40, QColor("#2b579a"))
+    painter.fillRect(0, 40, 220, 760, QColor("#e1e1e1"))
+    font = QFont()
+    font.setPixelSize(14)
+    painter.setFont(font)
+    for i in range(30):
+        painter.setPen(QColor("#202020") if i % 3 else QColor("#0066cc"))
+        painter.drawText(240, 70 + i * 24, f"Line {i}: The quick brown fox jumps over the lazy dog")
+    painter.setPen(QPen(QColor("#d13438"), 4))
+    painter.setBrush(QColor(255, 200, 0))
+    painter.drawEllipse(800, 300, 250, 250)
+    painter.end()
+    return image
+
+
+def test_ui_screenshot_with_hundreds_of_colors_is_quantized(tmp_path):
+    path = str(tmp_path / "ui.png")
+    image = ui_image()
+    original = qimage_to_array(image)
+    assert len(np.unique(original & 0xFFFFFF)) > 256
+    assert image.save(path)
+
+    _, original_size, new_size = optimize_png(path)
+    assert new_size < original_size
+    assert os.path.getsize(path) == new_size
+    optimized = QImage(path)
+    assert optimized.format() == QImage.Format_Indexed8
+    assert channel_error(qimage_to_array(optimized), original) <= PNG_MAX_ERROR
+
+
+def test_few_colors_stay_exact(tmp_path):
+    path = str(tmp_path / "flat.png")
+    image = QImage(400, 300, QImage.Format_RGB32)
+    image.fill(QColor("white"))
+    painter = QPainter(image)
+    painter.fillRect(50, 50, 100, 80, QColor("#2b579a"))
+    painter.fillRect(200, 100, 150, 150, QColor("#d13438"))
+    painter.end()
+    original = qimage_to_array(image)
+    # 未压缩写入，保证调色板版本更小
+    assert image.save(path, "PNG", 100)
+
+    _, original_size, new_size = optimize_png(path)
+    assert new_size < original_size
+    assert np.array_equal(qimage_to_array(QImage(path)), original)
+
+
+def test_noisy_image_is_left_alone(tmp_path):
+    path = str(tmp_path / "noise.png")
+    rng = np.random.default_rng(1)
+    pixels = (rng.integers(0, 1 << 24, size=(120, 160), dtype=np.uint32) | 0xFF000000)
+    image = QImage(pixels.data, 160, 120, 160 * 4, QImage.Format_RGB32).copy()
+    assert image.save(path)
+    size = os.path.getsize(path)
+
+    assert optimize_png(path) == (path, size, size)
+    assert os.path.getsize(path) == size
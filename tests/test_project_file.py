@@ -0,0 +1,52 @@
+import os
+
+from PyQt5.QtGui import QColor, QImage
+
+import screenshot_tool
+from screenshot_tool import load_project, save_project, update_project_ops
+
+
+def make_project(tmp_path):
+    image = QImage(64, 48, QImage.Format_RGB32)
+    image.fill(QColor("orange"))
+    path = str(tmp_path / "shot.sitm")
+    save_project(path, image, [], str(tmp_path / "shot.png"))
+    return path
+
+
+def ops(count):
+    return [{"tool": "pen", "points": [[i, i]] * 5} for i in range(count)]
+
+
+def test_update_ops_keeps_pixels_and_bounded_size(tmp_path):
+    path = make_project(tmp_path)
+    image, _, _, mapping = load_project(path)
+    for count in (3, 1, 8, 2, 0, 5):
+        update_project_ops(path, ops(count), str(tmp_path / "shot.png"))
+        loaded, loaded_ops, _, loaded_mapping = load_project(path)
+        assert loaded_ops == ops(count)
+        assert loaded.pixelColor(10, 10) == QColor("orange")
+        del loaded
+        loaded_mapping.close()
+    # 像素之后最多保留新旧两份记录
+    assert os.path.getsize(path) < 4096 + 64 * 4 * 48 + 2 * len(repr(ops(8))) + 200
+    assert image.pixelColor(10, 10) == QColor("orange")
+    del image
+    mapping.close()
+
+
+def test_interrupted_update_keeps_previous_ops(tmp_path, monkeypatch):
+    path = make_project(tmp_path)
+    update_project_ops(path, ops(2), str(tmp_path / "shot.png"))
+
+    def fail_fsync(fd):
+        raise OSError("disk full")
+
+    # 新记录写了一半就中断：文件头还指向旧记录
+    monkeypatch.setattr(screenshot_tool.os, "fsync", fail_fsync)
+    for count in (1, 6):
+        try:
+            update_project_ops(path, ops(count), str(tmp_path / "shot.png"))
+        except OSError:
+            pass
+        assert load_project(path)[1] == ops(2)
@@ -0,0 +1,36 @@
+import time
+
+import numpy as np
+from PyQt5.QtGui import QImage, QImageReader
+
+from screenshot_tool import FrameRingBuffer, RecordingEncoder, RecordingStats, qimage_to_array
+
+
+def make_frame(index):
+    """浅灰背景上移动的红块；第 3 帧起多出一个蓝块（全局调色板里没有的颜色）"""
+    pixels = np.full((100, 100), 0xFFF0F0F0, dtype=np.uint32)
+    pixels[10:20, 10 + index * 5:20 + index * 5] = 0xFFFF0000
+    if index >= 3:
+        pixels[60:80, 60:80] = 0xFF0000FF
+    image = QImage(pixels.data, 100, 100, 400, QImage.Format_RGB32)
+    return image.copy(), pixels
+
+
+def test_gif_frames_after_palette_rebuild(tmp_path):
+    path = str(tmp_path / "recording.gif")
+    buffer = FrameRingBuffer(16)
+    expected = []
+    for index in range(8):
+        image, pixels = make_frame(index)
+        buffer.push((image, time.monotonic() + index * 0.1))
+        expected.append(pixels)
+    buffer.close()
+
+    encoder = RecordingEncoder(buffer, path, "gif", RecordingStats())
+    assert encoder._encode(path) == 8
+
+    reader = QImageReader(path)
+    for index, pixels in enumerate(expected):
+        frame = reader.read()
+        assert not frame.isNull(), f"第 {index} 帧无法解码"
+        assert np.array_equal(qimage_to_array(frame), pixels), f"第 {index} 帧像素不一致"
@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import numpy as np
+from PyQt5.QtCore import QPoint, QRect
+from PyQt5.QtGui import QImage
+
+from screenshot_tool import EdgeIndex, RegionSelector
+
+
+def make_selector(ratio=1.0):
+    """白底上一个 100x60 的深色面板，位于 (50, 40)"""
+    width, height = int(300 * ratio), int(200 * ratio)
+    pixels = np.full((height, width), 0xFFFFFFFF, dtype=np.uint32)
+    pixels[int(40 * ratio):int(100 * ratio), int(50 * ratio):int(150 * ratio)] = 0xFF202020
+    image = QImage(pixels.data, width, height, width * 4, QImage.Format_RGB32).copy()
+    pixmap = SimpleNamespace(devicePixelRatio=lambda: ratio)
+    return SimpleNamespace(screen_pixmap=pixmap, snap_enabled=True,
+                           edge_index=EdgeIndex.from_image(image),
+                           SNAP_DISTANCE=RegionSelector.SNAP_DISTANCE)
+
+
+def select(selector, begin, end):
+    selector.begin, selector.begin_snapped = RegionSelector.snap_point(selector, begin)
+    selector.end, selector.end_snapped = RegionSelector.snap_point(selector, end)
+    return RegionSelector._selection_rect(selector)
+
+
+def test_snapped_selection_matches_panel():
+    selector = make_selector()
+    assert select(selector, QPoint(52, 43), QPoint(147, 98)) == QRect(50, 40, 100, 60)
+    # 反向拖动结果相同
+    assert select(selector, QPoint(148, 97), QPoint(53, 42)) == QRect(50, 40, 100, 60)
+
+
+def test_snapped_selection_on_hidpi():
+    selector = make_selector(2.0)
+    assert select(selector, QPoint(52, 43), QPoint(147, 98)) == QRect(50, 40, 100, 60)
+
+
+def test_unsnapped_corner_is_kept():
+    selector = make_selector()
+    assert select(selector, QPoint(20, 10), QPoint(250, 180)) == QRect(QPoint(20, 10), QPoint(250, 180))
+
+
+def test_loupe_centers_on_selection_corner():
+    selector = make_selector()
+    select(selector, QPoint(52, 43), QPoint(147, 98))
+    assert RegionSelector._end_corner(selector) == QPoint(149, 99)
+    select(selector, QPoint(148, 97), QPoint(53, 42))
+    assert RegionSelector._end_corner(selector) == QPoint(50, 40)
+    select(selector, QPoint(20, 10), QPoint(250, 180))
+    assert RegionSelector._end_corner(selector) == QPoint(250, 180)
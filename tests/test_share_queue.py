@@ -0,0 +1,72 @@
+import os
+import time
+
+from screenshot_tool import HttpShareSink, ShareQueue
+
+
+class FakeSink:
+    def __init__(self, uploaded):
+        self.uploaded = uploaded
+
+    def upload(self, path):
+        self.uploaded.append(path)
+        return "http://example/" + os.path.basename(path)
+
+    def close(self):
+        pass
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_bad_sink_factory_does_not_kill_workers(tmp_path):
+    image = tmp_path / "shot.png"
+    image.write_bytes(b"png")
+    queue = ShareQueue(str(tmp_path / "queue"), lambda: HttpShareSink("not a url"))
+    try:
+        queue.enqueue(str(image))
+        queue.enqueue(str(image))
+        time.sleep(0.3)
+        assert all(thread.is_alive() for thread in queue.threads)
+        assert queue.pending_count() == 2
+
+        uploaded = []
+        queue.set_sink_factory(lambda: FakeSink(uploaded))
+        assert wait_until(lambda: len(uploaded) == 2)
+        assert wait_until(lambda: not os.listdir(queue.jobs_dir))
+    finally:
+        queue.stop()
+
+
+def test_job_file_errors_keep_job_queued(tmp_path, monkeypatch):
+    image = tmp_path / "shot.png"
+    image.write_bytes(b"png")
+    calls = []
+
+    class FlakySink(FakeSink):
+        def upload(self, path):
+            calls.append(path)
+            if len(calls) == 1:
+                raise OSError("connection reset")
+            return super().upload(path)
+
+    uploaded = []
+    queue = ShareQueue(str(tmp_path / "queue"))
+    try:
+        queue.enqueue(str(image))
+
+        def broken_save(job):
+            raise OSError("disk full")
+        monkeypatch.setattr(queue, "_save_job", broken_save)
+        monkeypatch.setattr(ShareQueue, "MAX_BACKOFF", 0)
+        queue.set_sink_factory(lambda: FlakySink(uploaded))
+        assert wait_until(lambda: len(uploaded) == 1)
+        assert all(thread.is_alive() for thread in queue.threads)
+    finally:
+        queue.stop()
@@ -0,0 +1,88 @@
+import math
+
+import numpy as np
+from PyQt5.QtCore import QPointF
+from PyQt5.QtGui import QColor, QPixmap
+
+from screenshot_tool import ScreenshotEditor, simplify_stroke, stroke_samples
+
+
+def distance_to_polyline(point, polyline):
+    """点到折线（只看 x、y）的最短距离"""
+    p = np.asarray(point[:2], dtype=float)
+    best = math.inf
+    for a, b in zip(polyline[:-1], polyline[1:]):
+        a, b = np.asarray(a[:2], dtype=float), np.asarray(b[:2], dtype=float)
+        t = np.clip(np.dot(p - a, b - a) / max(np.dot(b - a, b - a), 1e-12), 0, 1)
+        best = min(best, float(np.hypot(*(p - (a + t * (b - a))))))
+    return best
+
+
+def arc(count, radius=60.0):
+    return [(200 + radius * math.cos(i * 0.02), 150 + radius * math.sin(i * 0.02), 3.0)
+            for i in range(count)]
+
+
+def make_editor():
+    pixmap = QPixmap(400, 300)
+    pixmap.fill(QColor("white"))
+    return ScreenshotEditor(pixmap)
+
+
+def draw(editor, points):
+    editor.begin_stroke(QPointF(*points[0][:2]), points[0][2], "mouse")
+    for x, y, width in points[1:-1]:
+        editor.extend_stroke(QPointF(x, y), width)
+    editor.end_stroke(QPointF(*points[-1][:2]))
+    return editor.ops[-1]["points"]
+
+
+def test_simplify_collapses_straight_run_to_endpoints():
+    line = [(10 + i * 0.7, 20 + i * 0.35, 3.0) for i in range(80)]
+    assert simplify_stroke(line, 0.5) == [line[0], line[-1]]
+
+
+def test_simplify_keeps_curve_within_tolerance():
+    points = arc(150)
+    simplified = simplify_stroke(points, 0.5)
+    assert simplified[0] == points[0] and simplified[-1] == points[-1]
+    assert len(simplified) < len(points) // 4
+    assert max(distance_to_polyline(point, simplified) for point in points) <= 0.5 + 1e-9
+
+
+def test_simplify_keeps_width_changes():
+    line = [(10 + i, 20.0, 3.0 if i < 20 else 8.0) for i in range(40)]
+    assert len(simplify_stroke(line, 0.5)) > 2
+
+
+def test_stroke_samples_pass_through_points_and_are_dense():
+    points = [(10.0, 10.0, 2.0), (60.0, 20.0, 3.0), (90.0, 70.0, 4.0), (40.0, 100.0, 2.0)]
+    samples = stroke_samples(points, spacing=3.0)
+    for point in points:
+        assert np.abs(samples - point).sum(axis=1).min() < 1e-9
+    gaps = np.hypot(*np.diff(samples[:, :2], axis=0).T)
+    assert gaps.max() <= 3.0 * 1.5
+    # 只取中间一段：从点 1 开始，到点 2 结束
+    middle = stroke_samples(points, 1, 2)
+    assert np.allclose(middle[0], points[1]) and np.allclose(middle[-1], points[2])
+
+
+def test_straight_input_is_decimated_online_to_endpoints():
+    editor = make_editor()
+    line = [(20 + i * 0.6, 30 + i * 0.3, 3.0) for i in range(120)]
+    stored = draw(editor, line)
+    assert editor.raw_point_count == len(line)
+    assert len(stored) == 2
+    assert stored[0] == [20.0, 30.0, 3.0]
+    assert np.allclose(stored[-1], line[-1], atol=0.01)
+
+
+def test_curved_input_is_reduced_and_stays_close():
+    editor = make_editor()
+    points = arc(200)
+    stored = draw(editor, points)
+    assert editor.raw_point_count == len(points)
+    assert len(stored) < len(points) // 4
+    samples = stroke_samples(stored).tolist()
+    # 简化容差 0.5 像素，加上保存时保留两位小数和平滑带来的少量偏差
+    assert max(distance_to_polyline(point, samples) for point in points) < 1.0